@@ -1,3 +1,3 @@
-from .frame import Frame
+from .frame import Frame, FrameBatch
 
-__all__ = ["Frame"]
+__all__ = ["Frame", "FrameBatch"]
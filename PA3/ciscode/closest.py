@@ -1,78 +1,305 @@
 from typing import Tuple
 import numpy as np
 from .frame import Frame
+from . import profiling
 
 
 def distance(
     point: np.ndarray, vertex: np.ndarray
-) -> np.float64:
+):
     """Computes distance between two points."""
     return np.linalg.norm(point - vertex)
 
 
-def brute_force(
-    a: np.ndarray, v: np.ndarray, t: np.ndarray
-) -> np.ndarray:
-    """Linearly searches triangles for closest surface triangle."""
-    min = np.inf
-    closest = 0
+# Number of query/triangle pairs evaluated per block in closest_points.
+CHUNK_SIZE = 2 ** 20
+
+
+class TriangleTable:
+    """Per-triangle terms of a mesh that every closest-point query reuses.
+
+    Triangle i is a[i] + s ab[i] + u ac[i] for s, u >= 0, s + u <= 1. The
+    edge vectors, their Gram terms, the inverse Gram determinants and a
+    bounding sphere per triangle are computed once and stored as
+    contiguous float64 arrays, so queries only do the per-point work. The
+    table describes the vertices it was built from; build a new one (or
+    call covtree.CovTree.refit) after they move.
+    """
+
+    # Per-triangle arrays, see __getitem__ and covtree.CovTree.__getstate__
+    fields = ["a", "ab", "ac", "aa", "bc", "cc", "a_ab", "a_ac", "a_a",
+              "inv_det", "center", "radius"]
+
+    def __init__(self, vertices: np.ndarray, t: np.ndarray):
+        """Compute the table for a triangle mesh.
+
+        Args:
+            vertices (np.ndarray): (N_v, 3) array of mesh vertices
+            t (np.ndarray): (N_t, >=3) array of triangle vertex indices
+        """
+        vertices = np.asarray(vertices, dtype=np.float64)
+        corners = vertices[np.asarray(t)[:, :3]]
+        a = np.ascontiguousarray(corners[:, 0])
+        self.a = a
+        self.ab = corners[:, 1] - a
+        self.ac = corners[:, 2] - a
+
+        self.aa = np.einsum("ij,ij->i", self.ab, self.ab)
+        self.bc = np.einsum("ij,ij->i", self.ab, self.ac)
+        self.cc = np.einsum("ij,ij->i", self.ac, self.ac)
+        self.a_ab = np.einsum("ij,ij->i", a, self.ab)
+        self.a_ac = np.einsum("ij,ij->i", a, self.ac)
+        self.a_a = np.einsum("ij,ij->i", a, a)
+
+        det = self.aa * self.cc - self.bc * self.bc
+        with np.errstate(divide="ignore"):
+            # Degenerate triangles never reach the interior region
+            self.inv_det = np.where(det > 0, 1 / det, 0.0)
+
+        self.center = corners.mean(axis=1)
+        self.radius = np.linalg.norm(
+            corners - self.center[:, None], axis=2).max(axis=1)
+
+    @classmethod
+    def from_arrays(cls, arrays: dict) -> "TriangleTable":
+        """Wrap precomputed arrays, e.g. from another table, without copying."""
+        table = cls.__new__(cls)
+        for name in cls.fields:
+            setattr(table, name, arrays[name])
+        return table
+
+    def arrays(self) -> dict:
+        return {name: getattr(self, name) for name in self.fields}
+
+    def __len__(self) -> int:
+        return self.a.shape[0]
+
+    def __getitem__(self, index) -> "TriangleTable":
+        """The table of a subset of the triangles."""
+        return self.from_arrays({name: a[index]
+                                 for name, a in self.arrays().items()})
+
+    def sphere_distance(self, points: np.ndarray,
+                        index: np.ndarray) -> np.ndarray:
+        """Lower bound on the distance from points[j] to triangle index[j]."""
+        gap = np.linalg.norm(points - self.center[index], axis=-1) \
+            - self.radius[index]
+        return np.maximum(gap, 0)
+
+    def closest_points(
+        self, points: np.ndarray, chunk_size: int = CHUNK_SIZE
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Computes the closest point on any triangle for every query point.
+
+        Each query is projected onto every triangle in closed form, using
+        the Voronoi region tests from Ericson's "Real-Time Collision
+        Detection" (section 5.1.5). Queries are processed in blocks so that
+        at most `chunk_size` query/triangle pairs are held in memory.
+
+        Args:
+            points (np.ndarray): (N, 3) array of query points
+            chunk_size (int): Query/triangle pairs evaluated per block
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: The (N,) distances,
+                the (N, 3) closest points and the (N,) indices of the
+                triangles they lie on.
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        a, ab, ac = self.a, self.ab, self.ac
+
+        N = points.shape[0]
+        dists = np.empty(N)
+        c = np.empty((N, 3))
+        index = np.empty(N, dtype=int)
+        rows = max(1, chunk_size // max(1, len(self)))
+        profiling.count("closest.triangle_tests", N * len(self))
+
+        for st in range(0, N, rows):
+            p = points[st: st + rows]
+
+            # d1 = ab . (p - a), d2 = ac . (p - a)
+            d1 = p @ ab.T - self.a_ab
+            d2 = p @ ac.T - self.a_ac
+            s, u = _region_coordinates(d1, d2, self.aa, self.bc, self.cc,
+                                       self.inv_det)
+
+            # |p - a - s ab - u ac|^2, expanded so no (n, N_t, 3) array is built
+            ap2 = np.einsum("ij,ij->i", p, p)[:, None] - 2 * (p @ a.T) \
+                + self.a_a
+            d_sq = (ap2 - 2 * (s * d1 + u * d2) + s * s * self.aa
+                    + 2 * s * u * self.bc + u * u * self.cc)
+            i = np.argmin(d_sq, axis=1)
+
+            r = np.arange(p.shape[0])
+            c_p = (a[i] + s[r, i, None] * ab[i] + u[r, i, None] * ac[i])
+            c[st: st + rows] = c_p
+            dists[st: st + rows] = np.linalg.norm(p - c_p, axis=-1)
+            index[st: st + rows] = i
+
+        return dists, c, index
+
+    def closest_points_pairwise(
+        self, points: np.ndarray, index: np.ndarray,
+        chunk_size: int = CHUNK_SIZE
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Computes the closest point on triangle index[j] to points[j].
 
-    for i, tri in enumerate(t):
-        p = v[tri[0]]
-        q = v[tri[1]]
-        r = v[tri[2]]
-        A = np.array([q - p, r - p]).T
-        B = (a - p).T
+        Args:
+            points (np.ndarray): (P, 3) array of query points
+            index (np.ndarray): (P,) triangle of each query
+            chunk_size (int): Pairs evaluated per block
 
-        x, _, _, _ = np.linalg.lstsq(A, B, rcond=None)
-        x = x.T
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The (P,) distances and the (P, 3)
+                closest points.
+        """
+        P = points.shape[0]
+        profiling.count("closest.triangle_tests", P)
+        dists = np.empty(P)
+        c = np.empty((P, 3))
 
-        c = p + x[0] * (q - p) + x[1] * (r - p)
+        for st in range(0, P, chunk_size):
+            p = points[st: st + chunk_size]
+            i = index[st: st + chunk_size]
+            a, ab, ac = self.a[i], self.ab[i], self.ac[i]
+            ap = p - a
 
-        # Check bound
-        if x[0] < 0:
-            c = triangle_bound(c, r, p)
-        elif x[1] < 0:
-            c = triangle_bound(c, p, q)
-        elif (x[0] + x[1]) > 1:
-            c = triangle_bound(c, q, r)
+            d1 = np.einsum("ij,ij->i", ab, ap)
+            d2 = np.einsum("ij,ij->i", ac, ap)
+            s, u = _region_coordinates(d1, d2, self.aa[i], self.bc[i],
+                                       self.cc[i], self.inv_det[i])
 
-        dist = distance(a, c)
-        if min > dist:
-            min = dist
-            closest = c
+            c_p = a + s[:, None] * ab + u[:, None] * ac
+            c[st: st + chunk_size] = c_p
+            dists[st: st + chunk_size] = np.linalg.norm(p - c_p, axis=-1)
 
-    return closest
+        return dists, c
 
 
-def triangle_bound(c, p, q):
-    """Computes point projected on triangle edge."""
-    l = np.dot((c - p), (q - p)) / np.dot((q - p), (q - p))
-    l_s = max(0, min(l, 1))
+def closest_points(
+    points: np.ndarray, vertices: np.ndarray,
+    t: np.ndarray, chunk_size: int = CHUNK_SIZE
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Computes the closest mesh point for every query point at once.
 
-    return (np.cross((p + l_s), (q - p)))
+    Builds a TriangleTable for the mesh on every call; keep the table
+    around instead when querying the same mesh repeatedly.
+
+    Args:
+        points (np.ndarray): (N, 3) array of query points
+        vertices (np.ndarray): (N_v, 3) array of mesh vertices
+        t (np.ndarray): (N_t, >=3) array of triangle vertex indices
+        chunk_size (int): Query/triangle pairs evaluated per block
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: The (N,) distances, the
+            (N, 3) closest points and the (N,) indices of the triangles
+            they lie on.
+    """
+    return TriangleTable(vertices, t).closest_points(points, chunk_size)
+
+
+def closest_points_pairwise(
+    points: np.ndarray, vertices: np.ndarray,
+    t: np.ndarray, chunk_size: int = CHUNK_SIZE
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Computes the closest point on triangle t[j] to points[j] for every j.
+
+    Unlike closest_points, queries are matched one-to-one with triangles,
+    which lets a search gather all of its candidate pairs into one call.
+
+    Args:
+        points (np.ndarray): (P, 3) array of query points
+        vertices (np.ndarray): (N_v, 3) array of mesh vertices
+        t (np.ndarray): (P, >=3) array of triangle vertex indices
+        chunk_size (int): Pairs evaluated per block
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The (P,) distances and the (P, 3)
+            closest points.
+    """
+    return TriangleTable(vertices, t).closest_points_pairwise(
+        points, np.arange(points.shape[0]), chunk_size)
+
+
+def _region_coordinates(
+    d1: np.ndarray, d2: np.ndarray,
+    aa: np.ndarray, bc: np.ndarray, cc: np.ndarray, inv_det: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Finds the closest point on each triangle as c = a + s ab + u ac.
+
+    Args:
+        d1 (np.ndarray): ab . (p - a) for every query/triangle pair
+        d2 (np.ndarray): ac . (p - a) for every query/triangle pair
+        aa (np.ndarray): ab . ab for every triangle
+        bc (np.ndarray): ab . ac for every triangle
+        cc (np.ndarray): ac . ac for every triangle
+        inv_det (np.ndarray): 1 / (aa cc - bc^2) for every triangle
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The coordinates s and u.
+    """
+    d3 = d1 - aa        # ab . (p - b)
+    d4 = d2 - bc        # ac . (p - b)
+    d5 = d1 - bc        # ab . (p - c)
+    d6 = d2 - cc        # ac . (p - c)
+
+    # va + vb + vc is the Gram determinant, so the interior needs no division
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        v_ab = d1 / (d1 - d3)
+        w_ac = d2 / (d2 - d6)
+        w_bc = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+    v_in = vb * inv_det
+    w_in = vc * inv_det
+
+    # Regions in the order they are tested by Ericson, first match wins
+    regions = [
+        (d1 <= 0) & (d2 <= 0),                          # vertex a
+        (d3 >= 0) & (d4 <= d3),                         # vertex b
+        (vc <= 0) & (d1 >= 0) & (d3 <= 0),              # edge ab
+        (d6 >= 0) & (d5 <= d6),                         # vertex c
+        (vb <= 0) & (d2 >= 0) & (d6 <= 0),              # edge ac
+        (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0),    # edge bc
+    ]
+    s = np.select(regions, [0, 1, v_ab, 0, 0, 1 - w_bc], v_in)
+    u = np.select(regions, [0, 0, 0, 1, w_ac, w_bc], w_in)
+
+    # Degenerate triangles can leave 0/0 in a region that was never taken
+    return np.nan_to_num(s, copy=False), np.nan_to_num(u, copy=False)
+
+
+def brute_force(
+    a: np.ndarray, v: np.ndarray, t: np.ndarray
+) -> Tuple[np.ndarray, int]:
+    """Linearly searches triangles for the closest point and its triangle."""
+    _, c, i = closest_points(a[np.newaxis], v, t)
+    return c[0], i[0]
 
 
 def find_closest(
     point: np.ndarray, vertices: np.ndarray,
-    t: np.ndarray, brute: bool = True
-) -> Tuple[np.float64, np.ndarray]:
+    t: np.ndarray
+) -> Tuple[np.float64, np.ndarray, int]:
     """Computes closest vertex to point and returns distance.
 
     Args:
-        points (np.ndarray): The point of interest
+        points (np.ndarray): The point of interest, or an (N, 3) array of
+            points to resolve in one call
         vertices (np.ndarray): List of vertices to be matched
         t (np.ndarray): List of triangle vertex indices
-        brute (bool): Whether or not to use brute-force search
 
     Returns:
-        Tuple[np.float32, np.ndarray]: The distance between the closest
-            two points, and the location of the closest vertex in CT
-            coordinates.
+        Tuple[np.float64, np.ndarray, int]: The distance between the
+            closest two points, the location of the closest vertex in CT
+            coordinates and the index of its triangle (arrays of each for
+            an (N, 3) input).
     """
-    if brute:
-        c = brute_force(point, vertices, t)
-        return distance(point, c), c
-    else:
-        c = brute_force(point, vertices, t)
-        return distance(point, c), c
+    if np.ndim(point) == 2:
+        return closest_points(point, vertices, t)
+    c, i = brute_force(point, vertices, t)
+    return distance(point, c), c, i
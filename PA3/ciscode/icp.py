@@ -0,0 +1,192 @@
+"""Iterative closest point registration of a point cloud to a surface.
+
+The engine alternates matching every point to the surface with a rigid
+re-registration of the points to their matches. Matching, convergence and
+outlier rejection are all pluggable, and every iteration is recorded so
+callers can inspect the run without any printing in the loop.
+"""
+from typing import Callable, List, NamedTuple, Optional, Tuple
+import time
+
+import numpy as np
+import logging
+
+from .frame import Frame
+from .closest import TriangleTable
+from . import profiling
+
+log = logging.getLogger(__name__)
+
+
+class IterationStats(NamedTuple):
+    """What happened in one ICP iteration."""
+
+    iteration: int
+    time: float
+    mean_residual: float
+    max_residual: float
+    n_rejected: int
+
+
+class Matches(NamedTuple):
+    """Closest surface points for every query point."""
+
+    dists: np.ndarray
+    c: np.ndarray
+    index: np.ndarray
+
+
+# A matcher maps (points, previous matches or None) to new matches
+Matcher = Callable[[np.ndarray, Optional[Matches]], Matches]
+Criterion = Callable[[List[IterationStats]], bool]
+Rejector = Callable[[np.ndarray], np.ndarray]
+
+
+def residual_change(rtol: float = 1e-5, atol: float = 1e-8) -> Criterion:
+    """Converge once the mean residual stops changing.
+
+    Args:
+        rtol (float): Relative tolerance between consecutive mean residuals.
+        atol (float): Absolute tolerance between consecutive mean residuals.
+
+    Returns:
+        Criterion: The convergence test.
+    """
+    def converged(stats: List[IterationStats]) -> bool:
+        if len(stats) < 2:
+            return False
+        return bool(np.isclose(stats[-1].mean_residual,
+                               stats[-2].mean_residual, rtol=rtol, atol=atol))
+    return converged
+
+
+def residual_below(tol: float) -> Criterion:
+    """Converge once the mean residual drops below `tol`.
+
+    Args:
+        tol (float): Mean residual to reach.
+
+    Returns:
+        Criterion: The convergence test.
+    """
+    def converged(stats: List[IterationStats]) -> bool:
+        return stats[-1].mean_residual < tol
+    return converged
+
+
+def reject_above(limit: float) -> Rejector:
+    """Reject matches further than `limit` from the surface.
+
+    Args:
+        limit (float): Largest residual kept.
+
+    Returns:
+        Rejector: Maps residuals to a mask of rejected points.
+    """
+    def reject(dists: np.ndarray) -> np.ndarray:
+        return dists > limit
+    return reject
+
+
+def reject_sigma(k: float = 3.0) -> Rejector:
+    """Reject matches more than `k` standard deviations above the mean.
+
+    Args:
+        k (float): Number of standard deviations kept.
+
+    Returns:
+        Rejector: Maps residuals to a mask of rejected points.
+    """
+    def reject(dists: np.ndarray) -> np.ndarray:
+        return dists > dists.mean() + k * dists.std()
+    return reject
+
+
+def matcher(surface) -> Matcher:
+    """Build the matching step for a surface.
+
+    Args:
+        surface: A tree with `query_batch` (e.g. covtree.CovTree), a
+            (vertices, triangles) pair searched by brute force, or an
+            (M, 3) point cloud matched to its nearest points.
+
+    Returns:
+        Matcher: Maps points and the previous matches to new matches.
+    """
+    if hasattr(surface, "query_batch"):
+        def match(points, prev):
+            hint = None if prev is None else prev.index
+            return Matches(*surface.query_batch(points, hint=hint))
+    elif isinstance(surface, tuple):
+        table = TriangleTable(*surface)
+
+        def match(points, prev):
+            return Matches(*table.closest_points(points))
+    else:
+        cloud = np.asarray(surface, dtype=np.float64)
+        sq = np.einsum("ij,ij->i", cloud, cloud)
+
+        def match(points, prev):
+            d2 = sq - 2 * points @ cloud.T
+            index = np.argmin(d2, axis=1)
+            c = cloud[index]
+            return Matches(np.linalg.norm(points - c, axis=1), c, index)
+    return match
+
+
+@profiling.timed("icp")
+def icp(
+    points: np.ndarray,
+    surface,
+    F_0: Optional[Frame] = None,
+    max_iter: int = 100,
+    converged: Optional[Criterion] = None,
+    reject: Optional[Rejector] = None,
+) -> Tuple[Frame, List[IterationStats], Matches]:
+    """Find the frame F that brings `points` onto `surface`.
+
+    Args:
+        points (np.ndarray): (N, 3) points to register.
+        surface: Anything accepted by `matcher`.
+        F_0 (Frame): Initial guess, identity by default.
+        max_iter (int): Maximum number of iterations.
+        converged (Criterion): Convergence test over the stats so far,
+            `residual_change()` by default.
+        reject (Rejector): Optional outlier rejection. Rejected points are
+            given no weight in the registration.
+
+    Returns:
+        Tuple[Frame, List[IterationStats], Matches]: The registration, the
+            per-iteration stats and the matches of the last iteration.
+    """
+    F = Frame(np.eye(3), np.zeros(3)) if F_0 is None else F_0
+    converged = residual_change() if converged is None else converged
+    match = matcher(surface)
+
+    stats = []
+    matches = None
+    for i in range(max_iter):
+        start = time.perf_counter()
+        profiling.count("icp.iterations")
+        matches = match(F @ points, matches)
+
+        weights = None
+        n_rejected = 0
+        if reject is not None:
+            rejected = reject(matches.dists)
+            n_rejected = int(rejected.sum())
+            weights = (~rejected).astype(np.float64)
+            if n_rejected == len(weights):
+                raise RuntimeError("every point was rejected")
+
+        F = Frame.from_points(points, matches.c, weights)
+
+        kept = matches.dists if weights is None else matches.dists[weights > 0]
+        stats.append(IterationStats(
+            i, time.perf_counter() - start, float(kept.mean()),
+            float(kept.max()), n_rejected))
+        log.debug("ICP %s", stats[-1])
+        if converged(stats):
+            break
+
+    return F, stats, matches
@@ -0,0 +1,119 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, List
+import json
+import os
+import time
+
+import numpy as np
+import logging
+
+from . import evaluation
+
+log = logging.getLogger(__name__)
+
+# Inputs shared by every dataset a worker runs, see _init
+_inputs = None
+
+
+def find_datasets(data_dir: Path, pattern: str) -> List[str]:
+    """Names of the datasets in data_dir matching a glob, e.g. "PA4-*-Debug".
+
+    Args:
+        data_dir (Path): Where the data is.
+        pattern (str): Glob over dataset names.
+
+    Returns:
+        List[str]: The sorted dataset names.
+    """
+    suffix = "-SampleReadingsTest.txt"
+    return sorted(p.name[: -len(suffix)]
+                  for p in Path(data_dir).glob(pattern + suffix))
+
+
+def _init(inputs: dict, log_level: int):
+    global _inputs
+    _inputs = inputs
+    logging.getLogger().setLevel(log_level)
+
+
+def _run(run: Callable, name: str, kwargs: dict) -> dict:
+    start = time.perf_counter()
+    try:
+        return run(name, _inputs, **kwargs)
+    except Exception as e:
+        # A failing dataset is recorded instead of ending the batch
+        log.exception(f"{name} failed")
+        return {"name": name, "time": time.perf_counter() - start,
+                "error": f"{type(e).__name__}: {e}"}
+    finally:
+        # The plots belong to this worker, wait for them here
+        evaluation.join_plots()
+
+
+def run_batch(run: Callable, names: List[str], inputs: dict,
+              jobs: int = None, **kwargs) -> List[dict]:
+    """Runs every dataset concurrently, sharing the loaded inputs.
+
+    The inputs are handed to each worker once, when it starts, so the
+    datasets only read their own sample readings. Workers log at the
+    caller's root log level, and progress is logged once per finished
+    dataset. A dataset that raises gets a record with its "error"
+    instead, and the other datasets still run.
+
+    Args:
+        run (Callable): The driver's run(name, inputs, **kwargs) -> record.
+        names (List[str]): Datasets to run.
+        inputs (dict): Inputs shared by every dataset.
+        jobs (int): Worker processes, all cores by default.
+        kwargs: Passed on to run.
+
+    Returns:
+        List[dict]: One record per dataset, in the order of names.
+    """
+    jobs = min(jobs or os.cpu_count(), max(len(names), 1))
+    with ProcessPoolExecutor(
+            jobs, initializer=_init,
+            initargs=(inputs, logging.getLogger().level)) as pool:
+        futures = {pool.submit(_run, run, name, kwargs): name
+                   for name in names}
+        for done, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            log.info("%d/%d datasets done, %s %s in %.3fs", done, len(names),
+                     futures[future],
+                     "failed" if "error" in record else "finished",
+                     record["time"])
+        return [future.result() for future in futures]
+
+
+def write_summary(records: List[dict], output_dir: Path) -> Path:
+    """Logs the per-dataset records and saves them as summary.json.
+
+    Args:
+        records (List[dict]): Records returned by run.
+        output_dir (Path): Where to store the summary.
+
+    Returns:
+        Path: The summary file.
+    """
+    for record in records:
+        if "error" in record:
+            log.error(f"{record['name']}: failed, {record['error']}")
+            continue
+        errors = ", ".join(f"{k} {v:.4f}" for k, v in record.items()
+                           if k not in ("name", "time"))
+        log.info(f"{record['name']}: {record['time']:.3f}s {errors}")
+
+    times = [record["time"] for record in records]
+    summary = {
+        "datasets": records,
+        "total_time": float(np.sum(times)),
+        "mean_time": float(np.mean(times)) if times else 0.0,
+        "failed": [record["name"] for record in records if "error" in record],
+    }
+    path = Path(output_dir) / "summary.json"
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+    log.info(f"{len(records)} datasets in {summary['total_time']:.3f}s, "
+             f"summary written to {path}")
+    return path
@@ -1,47 +1,92 @@
 from pathlib import Path
+from typing import List
+import io
 import logging
 
+import numpy as np
+
+from . import profiling
+
 log = logging.getLogger(__name__)
 
+# Rows formatted and written per chunk in Writer.write
+BLOCK_SIZE = 4096
+
+# One sample row: d (or s), c and their distance
+ROW_FORMAT = "  %6.2f   %6.2f   %6.2f       %6.2f   %6.2f   %6.2f    %6.3f"
+
 
 class Writer:
-    """Abstract output formatter class."""
+    """Abstract output formatter class.
+
+    Subclasses describe their output through `header` and `arrays`. Rows
+    are formatted a block at a time from one fixed template and streamed to
+    the file, so the whole text is never held in memory.
+    """
 
     def __init__(self, fname: str):
         self.fname = fname
 
-    def save(self, output_dir: str = "."):
+    def header(self) -> List[str]:
+        """Lines written before the sample rows."""
+        raise NotImplementedError
+
+    def rows(self) -> np.ndarray:
+        """(N_samps, 7) array of the d, c and diff columns."""
+        return np.column_stack([self.d, self.c, self.diff])
+
+    def arrays(self) -> dict:
+        """Named arrays stored in the binary sidecar."""
+        return {"d": self.d, "c": self.c, "diff": self.diff}
+
+    def write(self, file, block_size: int = BLOCK_SIZE):
+        """Writes the formatted output to an open text file."""
+        file.write("\n".join(self.header()))
+        rows = np.asarray(self.rows(), dtype=np.float64)
+        template = "\n" + ROW_FORMAT
+        for st in range(0, rows.shape[0], block_size):
+            block = rows[st: st + block_size]
+            file.write((template * block.shape[0]) % tuple(block.ravel()))
+
+    def __str__(self):
+        text = io.StringIO()
+        self.write(text)
+        return text.getvalue()
+
+    @profiling.timed("write")
+    def save(self, output_dir: str = ".", sidecar: bool = False):
+        """Writes the output file, optionally with an .npz of its arrays.
+
+        Args:
+            output_dir (str): Where to store the output.
+            sidecar (bool): Also save `arrays()` next to the text output,
+                see readers.OutputReader.
+        """
         output_dir = Path(output_dir)
         if not output_dir.exists():
             output_dir.mkdir()
-        with open(output_dir / self.fname, "w") as file:
-            file.write(str(self))
+        path = output_dir / self.fname
+        with open(path, "w", buffering=2 ** 20) as file:
+            self.write(file)
+        if sidecar:
+            np.savez(path.with_suffix(".npz"), **self.arrays())
 
-        log.info(f"Saved output to {output_dir / self.fname}")
+        log.info(f"Saved output to {path}")
 
 
 class PA3(Writer):
     """Output formatter class for programming assignment 3."""
 
     def __init__(self, name: str, d, c, D):
-        letter = name.split('-')[1]
-        super().__init__(f"pa3-{letter}-Output.txt")
+        # Named after the whole dataset, e.g. pa3-A-Debug-Output.txt, so
+        # datasets sharing a letter do not overwrite each other
+        dataset = name.split('-', 1)[1]
+        super().__init__(f"pa3-{dataset}-Output.txt")
         self.name = name
         self.d = d
         self.c = c
         self.diff = D
         self.N_samps = D.shape[0]
 
-    def __str__(self):
-        outputs = []
-        outputs.append(f"{self.N_samps}, {self.fname}")
-        for i in range(self.N_samps):
-            outputs += [
-                "  " +
-                "   ".join(map(lambda x: f"{x:>6.02f}", self.d[i])) +
-                "       " +
-                "   ".join(map(lambda x: f"{x:>6.02f}", self.c[i])) +
-                f"    {self.diff[i]:>6.03f}"
-            ]
-
-        return "\n".join(outputs)
+    def header(self) -> List[str]:
+        return [f"{self.N_samps}, {self.fname}"]
@@ -1,12 +1,12 @@
 import click
+import functools
 import logging
 from rich.logging import RichHandler
-from rich.progress import track
 import time
 from pathlib import Path
 import numpy as np
 
-from ciscode import readers, Frame, writers, closest, testing
+from ciscode import readers, Frame, FrameBatch, writers, closest, testing, evaluation, profiling, runner
 
 
 FORMAT = "%(message)s"
@@ -20,102 +20,145 @@ logging.basicConfig(
 log = logging.getLogger()
 
 
-@click.command()
-@click.option("-d", "--data-dir", default="PA3/data", help="Where the data is.")
-@click.option("-o", "--output_dir", default="PA3/outputs", help="Where to store outputs.")
-@click.option("-n", "--name", default="PA3-A-Debug", help="Which experiment to run.")
-def main(
-    data_dir: str = "data", output_dir: str = "outputs", name: str = "BLAHHHH-"
-):
-    data_dir = Path(data_dir).resolve()
-    output_dir = Path(output_dir).resolve()
-    if not output_dir.exists():
-        output_dir.mkdir()
-
-    # Read inputs
+def load_inputs(data_dir: Path) -> dict:
+    """Reads the inputs shared by every dataset."""
     A_bod = readers.ProblemXBodyY(data_dir / f"Problem3-BodyA.txt")
     B_bod = readers.ProblemXBodyY(data_dir / f"Problem3-BodyB.txt")
     mesh = readers.ProblemXMesh(data_dir / f"Problem3MeshFile.sur")
     log.debug(mesh)
+    return {"A_bod": A_bod, "B_bod": B_bod, "mesh": mesh}
+
+
+def run(name: str, inputs: dict, data_dir: Path, output_dir: Path,
+        sidecar: bool = False, plots: bool = True) -> dict:
+    """Runs one dataset and returns its timing and errors."""
+    A_bod = inputs["A_bod"]
+    B_bod = inputs["B_bod"]
+    mesh = inputs["mesh"]
     sample_readings = readers.SampleReadings(
-        data_dir / f"{name}-SampleReadingsTest.txt")
+        data_dir / f"{name}-SampleReadingsTest.txt", stream=True)
 
     log.debug("point-cloud to point-cloud registration")
 
-    d = np.empty((sample_readings.N_samps, 3))
-
     # Start timing
     start_time = time.time()
 
-    for k in track(range(sample_readings.N_samps), "Computing d_k's..."):
-        time.sleep(0.3)
-        marks = sample_readings.S[k]
-        a = marks[: A_bod.N_m]
-        b = marks[A_bod.N_m: A_bod.N_m + B_bod.N_m]
+    # Register sample frames a block at a time as they are read
+    d = []
+    with profiling.stage("register"):
+        for marks in sample_readings.blocks():
+            a = marks[:, : A_bod.N_m]
+            b = marks[:, A_bod.N_m: A_bod.N_m + B_bod.N_m]
+            F_A = FrameBatch.from_points(A_bod.Y, a)
+            F_B = FrameBatch.from_points(B_bod.Y, b)
 
-        F_A = Frame.from_points(A_bod.Y, a)
-        log.debug(f"{k}: F_A =\n{F_A}")
-        F_B = Frame.from_points(B_bod.Y, b)
-        log.debug(f"{k}: F_B =\n{F_B}")
-        d[k] = F_B.inv() @ F_A @ A_bod.t
+            # d_k = F_B,k^-1 @ F_A,k @ t for every sample in the block
+            d.append(F_B.inv() @ F_A @ A_bod.t[0])
+    d = np.concatenate(d)
 
     log.debug("computing s_k points using F_reg")
 
-    c = np.empty((sample_readings.N_samps, 3))
-    dists = np.empty((sample_readings.N_samps))
-
     # Assumption for PA3
     F_reg = Frame(np.eye(3, dtype=np.float64), np.array([0, 0, 0]))
 
-    for k in track(range(sample_readings.N_samps), "Computing s_k's..."):
-        s = F_reg @ d[k]
-        dist, c_k = closest.find_closest(s, mesh.V, mesh.trig)
-        c[k] = c_k
-        dists[k] = dist
+    # All s_k resolve against the mesh in one batched call, too short to
+    # be worth starting a worker pool for
+    s = F_reg @ d
+    dists, c, _ = closest.find_closest(s, mesh.V, mesh.trig)
 
     # End timing
     end_time = time.time()
     log.info(
         f"Execution Time: " f"{end_time - start_time}"
     )
+    record = {"name": name, "time": end_time - start_time}
 
     log.debug("writing output")
     output = writers.PA3(name, d, c, dists)
-    output.save(output_dir)
+    output.save(output_dir, sidecar=sidecar)
 
     log.debug(dists)
 
     ref_output_path = data_dir / (name + "-Output.txt")
     if ref_output_path.exists():
         ref = readers.OutputReader(ref_output_path)
-        log.info(
-            f"Mean d Error: " f"{np.linalg.norm(ref.d - output.d, axis=-1).mean()}"
-        )
-        log.info(
-            f"Max d Error: " f"{np.linalg.norm(ref.d - output.d, axis=-1).max()}"
-        )
-
-        log.info(
-            f"Mean c Error: " f"{np.linalg.norm(ref.c - output.c, axis=-1).mean()}"
-        )
-        log.info(
-            f"Max c Error: " f"{np.linalg.norm(ref.c - output.c, axis=-1).max()}"
-        )
-
-        log.info(
-            f"Mean Distance Error: " f"{np.linalg.norm(ref.diff - output.diff, axis=-1).mean()}"
-        )
-        log.info(
-            f"Max Distance Error: " f"{np.linalg.norm(ref.diff - output.diff, axis=-1).max()}"
-        )
-
+        record.update(testing.errors(output, ref))
+        log.info(f"Mean d Error: " f"{record['mean_d_error']}")
+        log.info(f"Max d Error: " f"{record['max_d_error']}")
+        log.info(f"Mean c Error: " f"{record['mean_c_error']}")
+        log.info(f"Max c Error: " f"{record['max_c_error']}")
+        log.info(f"Mean Distance Error: " f"{record['mean_distance_error']}")
+        log.info(f"Max Distance Error: " f"{record['max_distance_error']}")
+
+        refs = {"output": ref}
         ans_output_path = data_dir / (name + "-Answer.txt")
         if ans_output_path.exists():
-            ans = readers.OutputReader(ans_output_path)
+            refs["answer"] = readers.OutputReader(ans_output_path)
 
-            log.debug(
-                "run testing script to validate results against output and answer files given")
-            testing.resultsTable(name, output, ref, ans)
+        log.debug(
+            "validating results against output and answer files given")
+        result = evaluation.curves(output, refs)
+        evaluation.save_curves(result, output_dir / f"{name}-Accuracy.json")
+        if plots:
+            evaluation.plot_curves(name, result, Path("PA3/plots").resolve(),
+                                   background=True)
+
+    return record
+
+
+@click.command()
+@click.option("-d", "--data-dir", default="PA3/data", help="Where the data is.")
+@click.option("-o", "--output_dir", default="PA3/outputs", help="Where to store outputs.")
+@click.option("-n", "--name", default="PA3-A-Debug", help="Which experiment to run.")
+@click.option("-b", "--batch", default=None, help="Run every dataset matching a glob, e.g. 'PA3-*'.")
+@click.option("-j", "--jobs", default=0, help="Datasets run at once in batch mode, 0 uses every core.")
+@click.option("--sidecar", is_flag=True, help="Also save the outputs as .npz arrays.")
+@click.option("--plots/--no-plots", default=True, help="Draw accuracy plots in the background.")
+@click.option("--profile", is_flag=True, help="Save stage timings and counters as <name>-Profile.json.")
+@click.option("--cprofile", is_flag=True, help="Like --profile, and also save cProfile stats as <name>-Profile.pstats.")
+@click.option("-q", "--quiet", is_flag=True, help="Plain log lines, warnings and batch progress only.")
+def main(
+    data_dir: str = "data", output_dir: str = "outputs", name: str = "BLAHHHH-",
+    batch: str = None, jobs: int = 0, sidecar: bool = False,
+    plots: bool = True, profile: bool = False, cprofile: bool = False,
+    quiet: bool = False
+):
+    data_dir = Path(data_dir).resolve()
+    output_dir = Path(output_dir).resolve()
+    if not output_dir.exists():
+        output_dir.mkdir()
+
+    if quiet:
+        # No rich rendering or per-dataset details, only warnings and one
+        # progress line per finished dataset in batch mode
+        logging.basicConfig(level="WARNING", format="[%(asctime)s] %(message)s",
+                            datefmt="%X", force=True)
+        logging.getLogger("ciscode.runner").setLevel(logging.INFO)
+
+    profile = profile or cprofile
+    profiling.enable(profile)
+
+    # Read inputs
+    with profiling.stage("load_inputs"):
+        inputs = load_inputs(data_dir)
+    if profile:
+        profiling.save_report(output_dir / "Inputs-Profile.json")
+        profiling.enable(False)
+    kwargs = dict(data_dir=data_dir, output_dir=output_dir, sidecar=sidecar,
+                  plots=plots)
+
+    run_dataset = run
+    if profile:
+        run_dataset = functools.partial(
+            profiling.profile_run, run, cprofile=cprofile)
+
+    if batch is None:
+        run_dataset(name, inputs, **kwargs)
+    else:
+        names = runner.find_datasets(data_dir, batch)
+        records = runner.run_batch(run_dataset, names, inputs, jobs, **kwargs)
+        runner.write_summary(records, output_dir)
+    evaluation.join_plots()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,59 @@
+import json
+from types import SimpleNamespace
+
+import numpy as np
+
+from ciscode import evaluation, testing
+
+
+def make_pair(n: int = 200, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    ref = SimpleNamespace(d=rng.normal(size=(n, 3)), c=rng.normal(size=(n, 3)),
+                          diff=rng.normal(size=n))
+    noise = 10.0 ** rng.uniform(-4, 1, size=n)
+    out = SimpleNamespace(d=ref.d + noise[:, None], c=ref.c - noise[:, None],
+                          diff=ref.diff + noise)
+    out.c[0, 1] = np.nan
+    return out, ref
+
+
+def loop_accuracy(comp, true, err):
+    # Per-row reference for the broadcast version
+    ok = [np.all(np.fabs(comp[n] - true[n]) < err) for n in range(comp.shape[0])]
+    return 100 * np.mean(ok)
+
+
+def test_accuracy_matches_loop():
+    out, ref = make_pair()
+    for comp, true in [(out.d, ref.d), (out.c, ref.c), (out.diff, ref.diff)]:
+        acc = evaluation.accuracy(comp, true)
+        expected = [loop_accuracy(comp, true, t) for t in evaluation.THRESHOLDS]
+        assert np.allclose(acc, expected)
+        assert np.isclose(testing.test_similarity(comp, true, 0.1),
+                          loop_accuracy(comp, true, 0.1))
+
+
+def test_curves_json(tmp_path):
+    out, ref = make_pair()
+    result = evaluation.curves(out, {"output": ref, "answer": out})
+    assert np.all(result["answer"]["d"]["inaccuracy"] == 0)
+    assert result["answer"]["d"]["acceptable"] == evaluation.THRESHOLDS[0]
+    tight = evaluation.curves(out, {"output": ref}, thresholds=[1e-6])
+    assert tight["output"]["c"]["acceptable"] == -1
+
+    path = evaluation.save_curves(result, tmp_path / "curves.json")
+    with open(path) as f:
+        loaded = json.load(f)
+    assert np.allclose(loaded["output"]["d"]["inaccuracy"],
+                       result["output"]["d"]["inaccuracy"])
+    assert loaded["thresholds"] == list(evaluation.THRESHOLDS)
+
+
+def test_background_plots_are_joined(tmp_path):
+    out, ref = make_pair(20)
+    result = evaluation.curves(out, {"output": ref})
+    process = evaluation.plot_curves("demo", result, tmp_path / "plots",
+                                     background=True)
+    evaluation.join_plots()
+    assert process.exitcode == 0
+    assert len(list((tmp_path / "plots").iterdir())) == 3
@@ -0,0 +1,84 @@
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from ciscode import Frame, FrameBatch, pointer
+
+
+def random_frames(K: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    r = Rotation.random(K, random_state=seed).as_matrix()
+    p = rng.normal(scale=10, size=(K, 3))
+    return FrameBatch(r, p)
+
+
+def test_frame_batch_matches_frames():
+    F = random_frames(5)
+    G = random_frames(5, seed=1)
+    H = G[0]
+    points = np.random.default_rng(2).normal(size=(4, 3))
+
+    FG = F @ G
+    FH = F @ H
+    HF = H @ F
+    F_inv = F.inv()
+    for k in range(5):
+        assert np.allclose(np.array(FG[k]), np.array(F[k] @ G[k]))
+        assert np.allclose(np.array(FH[k]), np.array(F[k] @ H))
+        assert np.allclose(np.array(HF[k]), np.array(H @ F[k]))
+        assert np.allclose(np.array(F_inv[k]), np.array(F[k].inv()))
+    assert np.allclose(np.array(F), np.stack([np.array(F[k]) for k in range(5)]))
+
+
+def test_frame_batch_points():
+    F = random_frames(3)
+    points = np.random.default_rng(2).normal(size=(3, 4, 3))
+
+    assert (F @ points[0, 0]).shape == (3, 3)
+    assert np.allclose(F @ points[0, 0], [F[k] @ points[0, 0] for k in range(3)])
+    assert np.allclose(F @ points[0], [F[k] @ points[0] for k in range(3)])
+    assert np.allclose(F @ points, [F[k] @ points[k] for k in range(3)])
+    assert np.allclose(F.inv() @ (F @ points), points)
+
+    G = FrameBatch.from_frames(F[k] for k in range(3))
+    assert np.allclose(np.array(G), np.array(F))
+
+
+def test_frame_batch_from_points():
+    F = random_frames(4)
+    rng = np.random.default_rng(3)
+    a = rng.normal(scale=20, size=(6, 3))
+    b = F @ a
+
+    G = FrameBatch.from_points(a, b)
+    assert np.allclose(np.array(G), np.array(F))
+    for k in range(4):
+        assert np.allclose(np.array(Frame.from_points(a, b[k])), np.array(F[k]))
+
+    # A mirrored point set must still give a proper rotation
+    G = FrameBatch.from_points(a, -b)
+    assert np.allclose(np.linalg.det(G.r), 1)
+
+
+def test_frame_batch_from_points_weights():
+    F = random_frames(1)[0]
+    rng = np.random.default_rng(4)
+    a = rng.normal(scale=20, size=(8, 3))
+    b = F @ a
+    b[0] += 100
+    weights = np.ones(8)
+    weights[0] = 0
+
+    G = Frame.from_points(a, b, weights)
+    assert np.allclose(np.array(G), np.array(F))
+
+
+def test_pivot_calibration():
+    rng = np.random.default_rng(5)
+    markers = rng.normal(scale=20, size=(6, 3))
+    tip = np.array([1.0, 2.0, 100.0])
+    post = np.array([5.0, 6.0, 7.0])
+    r = Rotation.random(10, random_state=6).as_matrix()
+    points = np.einsum("kij,nj->kni", r, markers - tip) + post
+
+    _, _, p_post = pointer.pivot_calibration(points, return_post=True)
+    assert np.allclose(p_post, post)
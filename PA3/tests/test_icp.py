@@ -0,0 +1,55 @@
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from ciscode import Frame, icp
+from test_closest import make_mesh
+
+
+def sample_surface(V, trig, n: int = 200, seed: int = 0):
+    """Random points on the mesh, away from the borders of the height field."""
+    rng = np.random.default_rng(seed)
+    trig = trig[np.all((V[trig, 0] > 12) & (V[trig, 0] < 38)
+                       & (V[trig, 1] > 12) & (V[trig, 1] < 38), axis=1)]
+    t = trig[rng.integers(0, trig.shape[0], n)]
+    w = rng.dirichlet(np.ones(3), n)
+    return np.einsum("ni,nij->nj", w, V[t])
+
+
+def test_from_icp_recovers_frame():
+    V, trig = make_mesh()
+    points = sample_surface(V, trig)
+    F = Frame(Rotation.from_euler("xyz", [2, -1, 3], degrees=True).as_matrix(),
+              np.array([0.5, -0.3, 0.2]))
+    d = F.inv() @ points
+
+    F_reg, stats = Frame.from_surface_registration(
+        d, (V, trig), max_iter=200, converged=icp.residual_below(1e-3))
+    assert len(stats) < 200
+    assert np.allclose(np.array(F_reg), np.array(F), atol=2e-2)
+    assert stats[-1].mean_residual < stats[0].mean_residual
+    assert all(s.n_rejected == 0 for s in stats)
+
+
+def test_from_icp_point_cloud():
+    rng = np.random.default_rng(1)
+    ys = rng.normal(scale=10, size=(100, 3))
+    F = Frame(Rotation.from_euler("z", 1, degrees=True).as_matrix(),
+              np.array([0.1, 0.2, 0.0]))
+    F_reg, stats = Frame.from_icp(F.inv() @ ys, ys)
+    assert np.allclose(np.array(F_reg), np.array(F))
+    assert np.isclose(stats[-1].mean_residual, 0)
+
+
+def test_icp_rejects_outliers():
+    V, trig = make_mesh()
+    points = sample_surface(V, trig)
+    F = Frame(np.eye(3), np.array([0.3, 0.0, -0.2]))
+    d = F.inv() @ points
+    d[:5, 2] += 20
+
+    F_reg, stats, matches = icp.icp(d, (V, trig), reject=icp.reject_above(5),
+                                    max_iter=200,
+                                    converged=icp.residual_below(1e-6))
+    assert np.allclose(np.array(F_reg), np.array(F), atol=1e-3)
+    assert stats[-1].n_rejected == 5
+    assert matches.c.shape == d.shape
@@ -0,0 +1,61 @@
+import numpy as np
+
+from ciscode import closest, icp, parallel, profiling
+from test_closest import make_mesh, query_points
+
+
+def test_parallel_brute_force_bound():
+    V, trig = make_mesh(10)
+    points = query_points(V, 100)
+    brute, _, _ = closest.closest_points(points, V, trig)
+
+    with parallel.ParallelSearch((V, trig), workers=2, chunk_size=30) as search:
+        dists, _, index = search.query_batch(points, bound=2.0)
+        assert np.allclose(dists, np.where(brute < 2.0, brute, np.inf))
+        assert np.all((index < 0) == (brute >= 2.0))
+
+        # Usable as an ICP surface
+        _, stats, _ = icp.icp(points, search, max_iter=3)
+        assert len(stats) <= 3
+
+
+def test_parallel_splits_queries():
+    V, trig = make_mesh(10)
+    points = query_points(V, 200)
+    brute, _, _ = closest.closest_points(points, V, trig)
+
+    with parallel.ParallelSearch((V, trig), workers=4) as search:
+        assert search.chunk_length(200) == 50
+        assert search.chunk_length(3) == 1
+
+        # Every worker gets a share of a small query
+        submit, tasks = search.pool.submit, []
+        search.pool.submit = lambda *args: tasks.append(args) or submit(*args)
+        dists, _, _ = search.query_batch(points)
+        assert len(tasks) == 4
+        assert np.allclose(dists, brute)
+
+    search = parallel.ParallelSearch((V, trig), workers=4, min_chunk=80)
+    with search:
+        assert search.chunk_length(200) == 80
+
+
+def test_parallel_counts_reach_caller():
+    V, trig = make_mesh(10)
+    points = query_points(V, 100)
+
+    with parallel.ParallelSearch((V, trig), workers=2) as search:
+        profiling.reset()
+        profiling.enable()
+        try:
+            search.query_batch(points)
+        finally:
+            profiling.enable(False)
+        # Brute force tests every pair
+        assert profiling.report()["counters"] == {
+            "closest.triangle_tests": 100 * len(trig)}
+
+        # Nothing is sent back while profiling is off
+        profiling.reset()
+        search.query_batch(points)
+        assert profiling.report()["counters"] == {}
@@ -0,0 +1,41 @@
+import json
+
+from ciscode import closest, profiling
+from test_closest import make_mesh
+
+
+def test_disabled_records_nothing():
+    profiling.reset()
+    V, trig = make_mesh()
+    closest.find_closest(V[:10] + 1, V, trig)
+    assert profiling.report() == {"stages": {}, "counters": {}}
+
+
+def test_counts_brute_force():
+    V, trig = make_mesh()
+    profiling.reset()
+    profiling.enable()
+    try:
+        closest.find_closest(V[:10] + 1, V, trig)
+        closest.find_closest(V[0] + 1, V, trig)
+    finally:
+        profiling.enable(False)
+    assert profiling.report()["counters"] == {
+        "closest.triangle_tests": 11 * len(trig)}
+
+
+def test_profile_run(tmp_path):
+    def run(name, inputs, output_dir, scale):
+        with profiling.stage("work"):
+            profiling.count("items", 3)
+        return {"name": name, "value": inputs["x"] * scale}
+
+    record = profiling.profile_run(run, "demo", {"x": 2}, cprofile=True,
+                                   output_dir=tmp_path, scale=3)
+    assert record == {"name": "demo", "value": 6}
+    assert not profiling.enabled
+    with open(tmp_path / "demo-Profile.json") as f:
+        report = json.load(f)
+    assert set(report["stages"]) == {"total", "work"}
+    assert report["counters"] == {"items": 3}
+    assert (tmp_path / "demo-Profile.pstats").exists()
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from ciscode import readers
+
+
+def write_readings(path, S):
+    with open(path, "w") as f:
+        f.write(f"{S.shape[1]}, {S.shape[0]}, {path.name} 0\n")
+        for row in S.reshape(-1, 3):
+            f.write(",".join(f"{x:9.2f}" for x in row) + "\n")
+
+
+def test_sample_readings_stream(tmp_path):
+    S = np.round(np.random.default_rng(0).normal(scale=100, size=(7, 5, 3)), 2)
+    path = tmp_path / "readings.txt"
+    write_readings(path, S)
+
+    assert np.array_equal(readers.SampleReadings(path).S, S)
+
+    stream = readers.SampleReadings(path, stream=True)
+    assert not hasattr(stream, "S")
+    assert [b.shape[0] for b in stream.blocks(3)] == [3, 3, 1]
+    assert np.array_equal(np.concatenate(list(stream.blocks(3))), S)
+    assert np.array_equal(np.stack(list(stream)), S)
+
+
+def test_sample_readings_truncated(tmp_path):
+    S = np.zeros((4, 5, 3))
+    path = tmp_path / "readings.txt"
+    write_readings(path, S)
+    lines = path.read_text().splitlines(keepends=True)
+    path.write_text("".join(lines[:-2]))
+
+    with pytest.raises(RuntimeError):
+        readers.SampleReadings(path)
+
+
+def test_mesh_cache(tmp_path):
+    V = np.arange(12, dtype=np.float64).reshape(4, 3)
+    trig = np.array([[0, 1, 2, -1, -1, -1], [1, 2, 3, -1, -1, -1]])
+    path = tmp_path / "mesh.sur"
+
+    def write():
+        with open(path, "w") as f:
+            f.write(f"{V.shape[0]}\n")
+            np.savetxt(f, V, fmt="%.2f")
+            f.write(f"{trig.shape[0]}\n")
+            np.savetxt(f, trig, fmt="%d")
+    write()
+
+    mesh = readers.ProblemXMesh(path)
+    assert (tmp_path / "mesh.sur.cache" / "key.json").exists()
+    cached = readers.ProblemXMesh(path)
+    assert not cached.V.flags.writeable
+    assert np.array_equal(cached.V, V)
+    assert np.array_equal(cached.trig, trig)
+    assert (cached.N_v, cached.N_t) == (mesh.N_v, mesh.N_t) == (4, 2)
+
+    # A changed file invalidates the sidecar
+    V = V + 1
+    trig = trig[:1]
+    write()
+    mesh = readers.ProblemXMesh(path)
+    assert np.array_equal(mesh.V, V)
+    assert mesh.N_t == 1
@@ -0,0 +1,43 @@
+import numpy as np
+
+from ciscode import readers, writers
+
+
+def make_output(n: int = 10, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    d = rng.normal(scale=50, size=(n, 3))
+    c = d + rng.normal(size=(n, 3))
+    return writers.PA3("PA3-Z-Test", d, c, np.linalg.norm(d - c, axis=1))
+
+
+def test_write_matches_row_format():
+    output = make_output()
+    lines = str(output).split("\n")
+    assert lines[0] == "10, pa3-Z-Test-Output.txt"
+    for i, line in enumerate(lines[1:]):
+        assert line == (
+            "  " + "   ".join(f"{x:>6.02f}" for x in output.d[i]) + "       "
+            + "   ".join(f"{x:>6.02f}" for x in output.c[i])
+            + f"    {output.diff[i]:>6.03f}")
+
+
+def test_save_blocks_and_sidecar(tmp_path):
+    output = make_output(25)
+    output.save(tmp_path, sidecar=True)
+    text = (tmp_path / output.fname).read_text()
+    assert text == str(output)
+
+    # Chunked writes give the same text
+    with open(tmp_path / "blocks.txt", "w") as f:
+        output.write(f, block_size=4)
+    assert (tmp_path / "blocks.txt").read_text() == text
+
+    ref = readers.OutputReader(tmp_path / output.fname)
+    assert np.array_equal(ref.d, output.d)
+    assert ref.N_samps == 25 and ref.N_modes == 0
+
+    # Without the sidecar the rounded text is parsed
+    (tmp_path / output.fname).with_suffix(".npz").unlink()
+    ref = readers.OutputReader(tmp_path / output.fname)
+    assert np.allclose(ref.c, output.c, atol=5e-3)
+    assert np.allclose(ref.diff, output.diff, atol=5e-4)
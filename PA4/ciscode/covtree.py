@@ -1,197 +1,628 @@
+import heapq
+import logging
+import time
 import numpy as np
-from .thing import TriangleThing
+from .thing import TriangleThing, TriangleSet
 from .frame import Frame
+from .closest import CHUNK_SIZE, TriangleTable, triangle_neighbors
+from . import profiling
+
+log = logging.getLogger(__name__)
 
 
 class CovTreeNode:
+    """Covariance tree built from linked node objects.
+
+    Every node holds its triangles as a TriangleSet over the shared mesh
+    vertices, so building a node is a handful of array operations over
+    them: one covariance, one transform of every corner and a median split
+    with np.argpartition.
+    """
 
-    def __init__(self, Ts: list):
+    def __init__(self, Ts: TriangleSet):
+        if not isinstance(Ts, TriangleSet):
+            Ts = TriangleSet.from_things(Ts)
         self.Things = Ts
         self.nThings = len(Ts)
 
-        self.F = self.ComputeCovFrame()
-        self.UB, self.LB = self.FindBoundingBox()
-        self.ConstructSubtrees()
+        corners = Ts.corners
+        self.F = self.ComputeCovFrame(corners)
+        self.Finv = self.F.inv()
+        self.UB, self.LB = self.FindBoundingBox(corners)
+        self.ConstructSubtrees(corners)
 
-    def appInvFrame(self, F: Frame, T: TriangleThing) -> np.ndarray:
-        """Finds Thing coordinates with respect to mesh."""
-        return F.inv() @ T.sortPoint()
-
-    def extractPoints(self, Ts: np.ndarray, nT: int) -> np.ndarray:
+    def extractPoints(self, Ts: TriangleSet, nT: int) -> np.ndarray:
         """Return sort points for Thing."""
-        sort_points = np.empty((nT, 3))
-        for i in range(nT):
-            sort_points[i] = Ts[i].sortPoint()
-        return sort_points
-
-    def ComputeCovFrame(self):
-        """Extract sort points of all Things to compute covariance frame."""
-        Ts = self.Things
-        nT = self.nThings
-        Points = self.extractPoints(Ts, nT)
-        return self.FindCovFrame(Points, nT)
-
-    def getCentroid(self, Ps: np.ndarray, nP: int):
-        """Returns centroid of a series of points."""
-        x = np.sum(Ps[:, 0])
-        y = np.sum(Ps[:, 1])
-        z = np.sum(Ps[:, 2])
-        return np.array([x/nP, y/nP, z/nP])
-
-    def getRotMat(self, A: np.ndarray):
-        """Returns rotation matrix from A matrix."""
-        l, Q = np.linalg.eig(A)
-        qi = np.argmax(l)
-        qt = np.expand_dims(Q[:, qi], axis=1)
-        q = np.row_stack((0, qt))
-        R = np.array([[q[0]**2 + q[1]**2 - q[2]**2 - q[3]**2,
-                       2*(q[1]*q[2] - q[0]*q[3]),
-                       2*(q[1]*q[3] + q[0]*q[2])],
-
-                      [2*(q[1]*q[2] + q[0]*q[3]),
-                       q[0]**2 - q[1]**2 + q[2]**2 - q[3]**2,
-                       2*(q[2]*q[3] - q[0]*q[1])],
-
-                      [2*(q[1]*q[3] - q[0]*q[2]),
-                       2*(q[2]*q[3] + q[0]*q[1]),
-                       q[0]**2 - q[1]**2 - q[2]**2 + q[3]**2]])
-        return R.squeeze()
-
-    def FindCovFrame(self, Ps: np.ndarray, nP: int):
-        """Find covariance frame by finding centroid and rotation."""
-        C = self.getCentroid(Ps, nP)
-
-        A = 0
-        for i in range(nP):
-            A += np.outer(Ps[i, :3], Ps[i, :3])
-        R = self.getRotMat(A)
-
-        return Frame(R, C)
-
-    def FindBoundingBox(self):
-        """Find bounding box encompassing a list of Things."""
-        F = self.F
-        Things = self.Things
-        nThings = self.nThings
-
-        UB = self.appInvFrame(F, Things[0])
-        LB = self.appInvFrame(F, Things[0])
-
-        for k in range(nThings):
-            LB, UB = Things[k].enlargeBounds(F, LB, UB)
-
-        return [UB, LB]
-
-    def partition(self, arr, low, high):
-        """Returns pivot index for quicksort."""
-        i = (low-1)
-        pivot = self.appInvFrame(self.F, arr[high])[0]
-
-        for j in range(low, high):
-
-            # If current element is smaller than or
-            # equal to pivot
-            if self.appInvFrame(self.F, arr[j])[0] <= pivot:
-
-                # increment index of smaller element
-                i = i+1
-                arr[i], arr[j] = arr[j], arr[i]
-
-        arr[i+1], arr[high] = arr[high], arr[i+1]
-        return (i+1)
-
-    def quickSort(self, arr, low, high):
-        """Function to perform quicksort."""
-        if len(arr) == 1:
-            return arr
-        if low < high:
-            # pi is partitioning index, arr[p] is now
-            # at right place
-            p = self.partition(arr, low, high)
-
-            # Separately sort elements before
-            # partition and after pivot
-            self.quickSort(arr, low, p-1)
-            self.quickSort(arr, p+1, high)
-
-    def SplitSort(self):
-        """Find nSplit and reorder Things so that
-        F.inverse() @ (Thing[k]->SortPoint()).x < 0 iff k < nSplit."""
-        # This can be done in place by suitable exchanges
-        F = self.F
-        Ts = self.Things
-        nT = self.nThings
-
-        self.quickSort(Ts, 0, nT-1)
-        self.Things = Ts
-        for i in range(nT):
-            if ((self.appInvFrame(F, Ts[i]))[0] >= 0):
-                return i
-
-        return nT
-
-    def ConstructSubtrees(self, minCount=2, minDiag=5):
+        return Ts.sortPoint()
+
+    def ComputeCovFrame(self, corners: np.ndarray = None):
+        """Compute the covariance frame of the Things' sort points."""
+        if corners is None:
+            corners = self.Things.corners
+        R, p = CovTree.cov_frame(corners.mean(axis=1))
+        return Frame(R, p)
+
+    def FindBoundingBox(self, corners: np.ndarray = None):
+        """Find bounding box encompassing all Things, in the node frame."""
+        if corners is None:
+            corners = self.Things.corners
+        local = self.F.inv() @ corners.reshape(-1, 3)
+        return [local.max(axis=0), local.min(axis=0)]
+
+    def SplitSort(self, corners: np.ndarray = None):
+        """Reorder Things about the median of their sort points along the
+        node frame's major axis, returning the size of the lower half."""
+        if corners is None:
+            corners = self.Things.corners
+        x = (corners.mean(axis=1) - self.F.p) @ self.F.r[:, 0]
+        nSplit = self.nThings // 2
+        self.Things = self.Things[np.argpartition(x, nSplit)]
+        return nSplit
+
+    def ConstructSubtrees(self, corners: np.ndarray = None,
+                          minCount=2, minDiag=5):
         """Constructs subtrees for covTree."""
         if (self.nThings <= minCount or np.linalg.norm(self.UB-self.LB) <= minDiag):
             self.HaveSubtrees = 0
             return
 
         self.HaveSubtrees = 1
-        nSplit = self.SplitSort()
+        nSplit = self.SplitSort(corners)
         self.lSubtree = CovTreeNode(self.Things[0:nSplit])
         self.rSubtree = CovTreeNode(
             self.Things[nSplit:self.nThings])
 
-    def exhaustiveSearch(self, v, bound):
-        """Performs exhaustive search of all nodes in covTree."""
-        min_dist = np.inf
-        closest = np.empty(3)
-        for i in range(self.nThings):
-            temp = self.UpdateClosest(self.Things[i], v, bound)
-            temp_dist = np.linalg.norm(temp-v)
-            if (temp_dist < min_dist):
-                min_dist = temp_dist
-                closest = temp
-        return closest
-
-    def findClosestPoint(self, v: np.ndarray, bound: np.float64):
-        """Finds closest point in mesh to given coordinates."""
-        # Transform v to local coordinate system
-        vLocal = self.F.inv() @ v
-        if vLocal[0] > self.UB[0]+bound:
-            return
-        if vLocal[1] > self.UB[1]+bound:
-            return
-        if vLocal[2] > self.UB[2]+bound:
-            return
-        if vLocal[0] < self.LB[0]-bound:
-            return
-        if vLocal[1] < self.LB[1]-bound:
-            return
-        if vLocal[2] < self.LB[2]-bound:
-            return
-
-        if self.HaveSubtrees:  # Search left and right subtrees
-            lclosest = self.lSubtree.findClosestPoint(v, bound)
-            rclosest = self.rSubtree.findClosestPoint(v, bound)
-            if (lclosest is None and rclosest is None):
-                return self.exhaustiveSearch(v, bound)
-            elif (lclosest is None):
-                return rclosest
-            elif (rclosest is None):
-                return lclosest
-            elif (np.linalg.norm(lclosest-v) < np.linalg.norm(rclosest-v)):
-                return lclosest
-            else:
-                return rclosest
+    def boxDistance(self, v: np.ndarray) -> np.float64:
+        """Distance from v to this node's bounding box (0 if inside)."""
+        vLocal = self.Finv @ v
+        gap = np.maximum(self.LB - vLocal, vLocal - self.UB)
+        return np.linalg.norm(np.maximum(gap, 0))
+
+    def exhaustiveSearch(self, v, best):
+        """Checks every Thing in this node against the best match so far."""
+        self.UpdateClosest(self.Things, v, best)
+        return best
+
+    def findClosestPoint(self, v: np.ndarray, bound: np.float64 = np.inf,
+                         max_radius: np.float64 = None):
+        """Finds closest point in mesh to given coordinates.
+
+        Returns None if no point of the mesh is closer than bound.
+        """
+        if max_radius is not None:
+            bound = min(bound, max_radius)
+        return self.search(v, [bound, None])[1]
+
+    def search(self, v: np.ndarray, best: list) -> list:
+        """Branch and bound search, tightening best = [dist, point] in place."""
+        profiling.count("covtree.node_visits")
+        if self.boxDistance(v) >= best[0]:
+            profiling.count("covtree.pruned_subtrees")
+            return best
+
+        if self.HaveSubtrees:  # Search the nearer subtree first
+            subtrees = sorted([self.lSubtree, self.rSubtree],
+                              key=lambda T: T.boxDistance(v))
+            for subtree in subtrees:
+                subtree.search(v, best)
         else:  # Exhaustive search
-            return self.exhaustiveSearch(v, bound)
+            self.exhaustiveSearch(v, best)
+        return best
+
+    def UpdateClosest(self, T: TriangleThing, v: np.ndarray, best: list):
+        """Updates closest point if appropriate.
 
-    def UpdateClosest(self, T: TriangleThing, v: np.ndarray, bound: np.float64) -> np.ndarray:
-        """Updates closest point if appropriate."""
+        T may also be a TriangleSet, searched for its closest triangle.
+        """
         cp = T.closestPointTo(v)
         dist = np.linalg.norm(cp-v)
-        if (dist < bound):
-            bound = dist
-            return cp
-        return np.empty(3)
+        if (dist < best[0]):
+            best[0] = dist
+            best[1] = cp
+
+
+class CovTree:
+    """Covariance tree stored as flat arrays, one row per node.
+
+    Nodes are numbered in the order they are created, so a node's children
+    always come after it. Node k holds the triangles
+    `order[start[k]:end[k]]`, its covariance frame (`R[k]`, `p[k]`) and the
+    bounding box `LB[k]`, `UB[k]` of those triangles in that frame. Leaves
+    have `left[k] == right[k] == -1`. Triangles are evaluated through a
+    closest.TriangleTable of the mesh, kept in `table`.
+    """
+
+    # Arrays that fully describe a built tree, with the triangle table's
+    # arrays added by __getstate__, see save and load
+    fields = ["V", "trig", "order", "R", "p", "LB", "UB",
+              "left", "right", "start", "end", "ring_ptr", "ring",
+              "params", "box_size", "fit_V", "fit_LB", "fit_UB"]
+
+    def __init__(self, V: np.ndarray, trig: np.ndarray,
+                 min_count: int = 8, min_diag: float = 0.0):
+        """Build the tree over a triangle mesh.
+
+        Args:
+            V (np.ndarray): (N_v, 3) array of mesh vertices
+            trig (np.ndarray): (N_t, >=3) array of triangle vertex indices
+            min_count (int): Nodes with this many triangles or fewer are leaves
+            min_diag (float): Nodes with a smaller box diagonal are leaves
+        """
+        self.V = np.asarray(V, dtype=np.float64)
+        self.trig = np.ascontiguousarray(np.asarray(trig)[:, :3])
+        self.order = np.arange(self.trig.shape[0])
+        self.table = TriangleTable(self.V, self.trig)
+        self.ring_ptr, self.ring = triangle_neighbors(self.trig)
+        self.params = np.array([min_count, min_diag], dtype=np.float64)
+        self.build(min_count, min_diag)
+
+    @property
+    def n_nodes(self) -> int:
+        return self.R.shape[0]
+
+    @profiling.timed("covtree.build")
+    def build(self, min_count: int, min_diag: float):
+        """Split the triangles into nodes, one tree level at a time.
+
+        Median splits keep the nodes of a level within one triangle of the
+        same size, so a level is laid out as a (nodes, largest node) grid,
+        padding a node by repeating its last triangle. The covariances and
+        boxes are then batched matrix products, the frames come from one
+        stacked eigendecomposition, and each node's triangles are ordered
+        along its major axis by one row-wise sort.
+        """
+        corners = self.V[self.trig]
+        centers = corners.mean(axis=1)
+        N_t = self.order.shape[0]
+
+        R, p, LB, UB = [], [], [], []
+        left, right = [np.array([-1])], [np.array([-1])]
+        start, end = [np.array([0])], [np.array([N_t])]
+        first_id = 0
+
+        while True:
+            st, en = start[-1], end[-1]
+            K = st.shape[0]
+            counts = en - st
+            M = counts.max()
+            valid = np.arange(M) < counts[:, None]
+            slots = st[:, None] + np.minimum(np.arange(M), counts[:, None] - 1)
+
+            # Covariance frame of each node's triangle centers
+            tris = self.order[slots]
+            c = centers[tris]
+            p_k = np.einsum("km,kmi->ki", valid, c) / counts[:, None]
+            U = (c - p_k[:, None]) * valid[:, :, None]
+            _, Q = np.linalg.eigh(np.matmul(U.transpose(0, 2, 1), U))
+            R_k = Q[:, :, ::-1].copy()
+            R_k[np.linalg.det(R_k) < 0, :, 2] *= -1
+
+            # Boxes of the corners, the padding repeats corners already in.
+            # Local axes come first so the reductions run over contiguous
+            # memory
+            X = corners[tris].reshape(K, 3 * M, 3)
+            local = np.matmul(R_k.transpose(0, 2, 1), X.transpose(0, 2, 1))
+            p_local = np.einsum("ki,kij->kj", p_k, R_k)
+            LB_k = local.min(axis=2) - p_local
+            UB_k = local.max(axis=2) - p_local
+            R.append(R_k)
+            p.append(p_k)
+            LB.append(LB_k)
+            UB.append(UB_k)
+
+            split = (counts > max(min_count, 1)) & \
+                (np.linalg.norm(UB_k - LB_k, axis=1) > min_diag)
+            if not split.any():
+                break
+
+            # Median split along the major axis keeps the tree balanced,
+            # padding sorts last and is dropped
+            x = np.einsum("kmi,ki->km", U, R_k[:, :, 0])
+            x[~valid] = np.inf
+            ordered = np.take_along_axis(tris, np.argsort(x, axis=1), axis=1)
+            self.order[slots[valid]] = ordered[valid]
+
+            n_split = np.count_nonzero(split)
+            half = st[split] + counts[split] // 2
+            ids = first_id + K + np.arange(n_split)
+            left[-1][split], right[-1][split] = ids, ids + n_split
+            start.append(np.concatenate([st[split], half]))
+            end.append(np.concatenate([half, en[split]]))
+            left.append(np.full(2 * n_split, -1))
+            right.append(np.full(2 * n_split, -1))
+            first_id += K
+
+        self.R = np.concatenate(R)
+        self.p = np.concatenate(p)
+        self.LB = np.concatenate(LB)
+        self.UB = np.concatenate(UB)
+        self.left = np.concatenate(left)
+        self.right = np.concatenate(right)
+        self.start = np.concatenate(start)
+        self.end = np.concatenate(end)
+        self.box_size = self.size()
+
+        # Shape and boxes of the last build, which bound later refits
+        self.fit_V = self.V.copy()
+        self.fit_LB = self.LB.copy()
+        self.fit_UB = self.UB.copy()
+
+    def size(self) -> np.float64:
+        """Sum of the box diagonals of every node, lower is tighter."""
+        return np.linalg.norm(self.UB - self.LB, axis=1).sum()
+
+    def levels(self) -> list:
+        """Node indices of every tree level, root first."""
+        levels = [np.array([0])]
+        while True:
+            inner = levels[-1][self.left[levels[-1]] >= 0]
+            if inner.size == 0:
+                return levels
+            levels.append(np.concatenate([self.left[inner], self.right[inner]]))
+
+    @profiling.timed("covtree.refit")
+    def refit(self, V: np.ndarray = None, max_inflation: float = 1.5) -> bool:
+        """Refit the boxes to moved vertices, keeping the tree topology.
+
+        The triangle table is recomputed for the new vertices. Node frames
+        and triangle assignments are kept. Leaf boxes are refit to their
+        triangles in one vectorized pass, then every inner box is refit
+        bottom-up, one level at a time, to the 8 corners of its two
+        children's boxes. Boxes of rotated children compound as they go up,
+        so each inner box is also clipped to its box from the last build,
+        grown by the largest move of a vertex below it, which keeps it
+        tight for small deformations. The cost is one pass over the
+        triangles plus one over the nodes. As the mesh deforms, the old
+        splits fit it worse and the boxes grow; once their total size
+        exceeds `max_inflation` times the size after the last build, the
+        tree is rebuilt instead.
+
+        Args:
+            V (np.ndarray): (N_v, 3) new vertices, by default the vertex
+                array the tree was built on, which may have moved in place
+            max_inflation (float): Rebuild past this ratio of box sizes
+
+        Returns:
+            bool: Whether the tree was rebuilt
+        """
+        if V is not None:
+            self.V = np.asarray(V, dtype=np.float64)
+        self.table = TriangleTable(self.V, self.trig)
+
+        # Leaves own disjoint runs of triangle slots covering the mesh
+        leaves = np.flatnonzero(self.left < 0)
+        leaves = leaves[np.argsort(self.start[leaves])]
+        counts = self.end[leaves] - self.start[leaves]
+        owner = np.repeat(leaves, counts)
+        firsts = np.cumsum(counts) - counts
+        corners = self.trig[self.order]
+        local = np.matmul(self.V[corners] - self.p[owner, None],
+                          self.R[owner])
+        self.LB[leaves] = np.minimum.reduceat(local.min(axis=1), firsts)
+        self.UB[leaves] = np.maximum.reduceat(local.max(axis=1), firsts)
+
+        # Largest vertex move since the last build below every node
+        moved = np.zeros(self.n_nodes)
+        step = np.linalg.norm(self.V - self.fit_V, axis=1)
+        moved[leaves] = np.maximum.reduceat(step[corners].max(axis=1), firsts)
+
+        # Inner boxes from their children's boxes, deepest level first
+        bits = np.array([[i >> 2 & 1, i >> 1 & 1, i & 1] for i in range(8)],
+                        dtype=bool)
+        for nodes in reversed(self.levels()):
+            nodes = nodes[self.left[nodes] >= 0]
+            if nodes.size == 0:
+                continue
+            kids = np.stack([self.left[nodes], self.right[nodes]], axis=1)
+            box = np.where(bits, self.UB[kids][:, :, None],
+                           self.LB[kids][:, :, None])
+            # Child frame to parent frame, local_k = local_j R_j^T R_k + ...
+            R_jk = np.matmul(self.R[kids].transpose(0, 1, 3, 2),
+                             self.R[nodes][:, None])
+            p_jk = np.einsum("kji,kil->kjl",
+                             self.p[kids] - self.p[nodes][:, None],
+                             self.R[nodes])
+            local = np.matmul(box, R_jk) + p_jk[:, :, None]
+            moved[nodes] = moved[kids].max(axis=1)
+            self.LB[nodes] = np.maximum(
+                local.min(axis=(1, 2)),
+                self.fit_LB[nodes] - moved[nodes, None])
+            self.UB[nodes] = np.minimum(
+                local.max(axis=(1, 2)),
+                self.fit_UB[nodes] + moved[nodes, None])
+
+        inflation = self.size() / self.box_size
+        log.debug("covariance tree refit, box inflation %.2f", inflation)
+        profiling.count("covtree.refits")
+        if inflation > max_inflation:
+            profiling.count("covtree.rebuilds")
+            self.order = np.arange(self.trig.shape[0])
+            self.build(int(self.params[0]), self.params[1])
+            return True
+        return False
+
+    @staticmethod
+    def cov_frame(points: np.ndarray):
+        """Returns the rotation and centroid of a point set's covariance frame.
+
+        The columns of the rotation are the principal axes, major first.
+        """
+        centroid = points.mean(axis=0)
+        U = points - centroid
+        _, Q = np.linalg.eigh(U.T @ U)
+        R = Q[:, ::-1].copy()
+        if np.linalg.det(R) < 0:
+            R[:, 2] *= -1
+        return R, centroid
+
+    def box_distance(self, k, v: np.ndarray) -> np.float64:
+        """Distance from v, or each row of v, to the box of node k.
+
+        k may also be an array with one node per row of v.
+        """
+        local = np.einsum("...i,...ij->...j", v - self.p[k], self.R[k])
+        gap = np.maximum(self.LB[k] - local, local - self.UB[k])
+        return np.linalg.norm(np.maximum(gap, 0), axis=-1)
+
+    def find_closest_point(self, v: np.ndarray, bound: np.float64 = np.inf,
+                           max_radius: np.float64 = None, hint: int = -1):
+        """Finds the closest point on the mesh to v within distance bound.
+
+        Nodes are searched best-first, nearest box first, so the bound
+        shrinks as soon as possible and the search stops once no remaining
+        box is closer than the best triangle found.
+
+        Args:
+            v (np.ndarray): The query point
+            bound (np.float64): Only points closer than this are returned
+            max_radius (np.float64): Optional cutoff, applied on top of bound
+            hint (int): A triangle likely to be close, such as the match
+                from the previous ICP iteration; it and its 1-ring are
+                checked first to seed the bound
+
+        Returns:
+            Tuple[np.float64, np.ndarray, int]: The distance, the closest
+                point and the index of its triangle. If nothing lies within
+                bound, these are inf, NaN and -1.
+        """
+        if max_radius is not None:
+            bound = min(bound, max_radius)
+        best = (bound, np.full(3, np.nan), -1)
+        if hint >= 0:
+            tris = self.ring[self.ring_ptr[hint]:self.ring_ptr[hint + 1]]
+            dists, c, i = self.table[tris].closest_points(v)
+            if dists[0] < best[0]:
+                best = (dists[0], c[0], tris[i[0]])
+
+        heap = [(self.box_distance(0, v), 0)]
+        while heap:
+            gap, k = heapq.heappop(heap)
+            if gap >= best[0]:
+                profiling.count("covtree.pruned_subtrees", len(heap) + 1)
+                break
+            profiling.count("covtree.node_visits")
+
+            if self.left[k] < 0:
+                tris = self.order[self.start[k]:self.end[k]]
+                dists, c, i = self.table[tris].closest_points(v)
+                if dists[0] < best[0]:
+                    best = (dists[0], c[0], tris[i[0]])
+                continue
+
+            for j in (self.left[k], self.right[k]):
+                gap = self.box_distance(j, v)
+                if gap < best[0]:
+                    heapq.heappush(heap, (gap, j))
+                else:
+                    profiling.count("covtree.pruned_subtrees")
+
+        if best[2] < 0:
+            return np.inf, best[1], -1
+        return best
+
+    @profiling.timed("covtree.query_batch")
+    def query_batch(self, points: np.ndarray, bound: np.float64 = np.inf,
+                    max_radius: np.float64 = None, check: bool = False,
+                    hint: np.ndarray = None):
+        """Finds the closest mesh point for a whole block of points at once.
+
+        This is the best-first search of find_closest_point run for every
+        point together. Each query keeps a frontier of (node, box distance)
+        entries; every round, each query expands the nearest entry still
+        closer than its bound, so the Python loop runs once per round
+        rather than once per node or point. Leaves reached in a round are
+        searched in one vectorized call before the next round prunes, so
+        the bounds tighten as early as they do for a single point.
+
+        Args:
+            points (np.ndarray): (N, 3) array of query points
+            bound (np.float64): Only points closer than this are returned,
+                either one value or one per query
+            max_radius (np.float64): Optional cutoff, applied on top of bound
+            check (bool): Also run a brute-force search over every triangle,
+                log both timings and raise if the two disagree
+            hint (np.ndarray): (N,) triangle indices likely to be close, such
+                as the matches from the previous ICP iteration, or -1. A
+                hinted query seeds its bound from its triangle and 1-ring
+                before the search starts.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: The (N,) distances,
+                the (N, 3) closest points and the (N,) triangle indices.
+                Queries with nothing within bound get inf, NaN and -1.
+        """
+        start = time.perf_counter()
+        points = np.atleast_2d(points)
+        N = points.shape[0]
+        dists = np.broadcast_to(np.asarray(bound, np.float64), (N,)).copy()
+        if max_radius is not None:
+            dists = np.minimum(dists, max_radius)
+        limit = dists.copy()
+        c = np.full((N, 3), np.nan)
+        index = np.full(N, -1)
+
+        # Seed hinted points from the 1-ring of their hint
+        if hint is not None:
+            hint = np.asarray(hint)
+            hinted = np.flatnonzero(hint >= 0)
+            first = self.ring_ptr[hint[hinted]]
+            counts = self.ring_ptr[hint[hinted] + 1] - first
+            self.search_candidates(
+                np.repeat(hinted, counts), self.ring[_ranges(first, counts)],
+                points, dists, c, index)
+
+        # Frontier entries as parallel arrays of query, node and box gap
+        q = np.arange(N)
+        k = np.zeros(N, dtype=int)
+        gap = self.box_distance(0, points)
+        while q.size:
+            keep = gap < dists[q]
+            if profiling.enabled:
+                profiling.count("covtree.pruned_subtrees",
+                                keep.size - keep.sum())
+            q, k, gap = q[keep], k[keep], gap[keep]
+            if q.size == 0:
+                break
+
+            # Take the nearest entry of every query off the frontier
+            order = np.lexsort((gap, q))
+            q, k, gap = q[order], k[order], gap[order]
+            nearest = np.ones(q.size, dtype=bool)
+            nearest[1:] = q[1:] != q[:-1]
+            top_q, top_k = q[nearest], k[nearest]
+            q, k, gap = q[~nearest], k[~nearest], gap[~nearest]
+            profiling.count("covtree.node_visits", top_q.size)
+
+            leaf = self.left[top_k] < 0
+            self.search_leaves(top_q[leaf], top_k[leaf],
+                               points, dists, c, index)
+
+            # Replace inner nodes with both children
+            top_q, top_k = top_q[~leaf], top_k[~leaf]
+            top_q = np.concatenate([top_q, top_q])
+            top_k = np.concatenate([self.left[top_k], self.right[top_k]])
+            q = np.concatenate([q, top_q])
+            k = np.concatenate([k, top_k])
+            gap = np.concatenate([gap,
+                                  self.box_distance(top_k, points[top_q])])
+
+        dists[index < 0] = np.inf
+        if check:
+            self.check(points, dists, limit, time.perf_counter() - start)
+        return dists, c, index
+
+    def check(self, points: np.ndarray, dists: np.ndarray,
+              limit: np.ndarray, elapsed: float = None):
+        """Raises if a brute-force search disagrees with tree distances.
+
+        Args:
+            points (np.ndarray): (N, 3) array of query points
+            dists (np.ndarray): (N,) distances found with the tree
+            limit (np.ndarray): (N,) search bounds the tree was given
+            elapsed (float): Seconds the tree search took, for the log
+        """
+        start = time.perf_counter()
+        brute, _, _ = self.table.closest_points(points)
+        brute_time = time.perf_counter() - start
+        if elapsed is not None:
+            log.info(f"Tree search {elapsed:.4f}s, brute force "
+                     f"{brute_time:.4f}s ({brute_time / elapsed:.1f}x)")
+        expected = np.where(brute < limit, brute, np.inf)
+        wrong = ~np.isclose(expected, dists)
+        if np.any(wrong):
+            raise RuntimeError(
+                f"covariance tree disagrees with brute force on "
+                f"{np.count_nonzero(wrong)} of {points.shape[0]} points")
+
+    def search_leaves(self, q: np.ndarray, leaves: np.ndarray,
+                      points: np.ndarray, dists: np.ndarray, c: np.ndarray,
+                      index: np.ndarray, chunk_size: int = CHUNK_SIZE):
+        """Updates the best match of each q[j] with the triangles of leaves[j].
+
+        The (query, triangle) pairs are built and searched about
+        `chunk_size` at a time, so far-away queries that prune little
+        do not hold every pair in memory at once.
+        """
+        counts = self.end[leaves] - self.start[leaves]
+        block = (np.cumsum(counts) - counts) // chunk_size
+        for b in np.unique(block):
+            sel = block == b
+            self.search_candidates(
+                np.repeat(q[sel], counts[sel]),
+                self.order[_ranges(self.start[leaves[sel]], counts[sel])],
+                points, dists, c, index, chunk_size)
+
+    def search_candidates(self, q: np.ndarray, tris: np.ndarray,
+                          points: np.ndarray, dists: np.ndarray,
+                          c: np.ndarray, index: np.ndarray,
+                          chunk_size: int = CHUNK_SIZE):
+        """Updates the best matches with every (query, triangle) pair.
+
+        Pairs are taken `chunk_size` at a time. Pairs whose triangle's
+        bounding sphere is already further than the query's bound are
+        dropped; the rest are evaluated in one pairwise call, then reduced
+        to the nearest candidate per query.
+        """
+        for st in range(0, q.size, chunk_size):
+            self._search_pairs(q[st:st + chunk_size],
+                               tris[st:st + chunk_size],
+                               points, dists, c, index)
+
+    def _search_pairs(self, q: np.ndarray, tris: np.ndarray,
+                      points: np.ndarray, dists: np.ndarray,
+                      c: np.ndarray, index: np.ndarray):
+        keep = self.table.sphere_distance(points[q], tris) < dists[q]
+        if profiling.enabled:
+            profiling.count("covtree.sphere_pruned", keep.size - keep.sum())
+        q, tris = q[keep], tris[keep]
+        if q.size == 0:
+            return
+        pair_dists, pair_c = self.table.closest_points_pairwise(
+            points[q], tris)
+
+        # Nearest candidate for each query
+        order = np.lexsort((pair_dists, q))
+        q_first, first = np.unique(q[order], return_index=True)
+        best = order[first]
+
+        better = pair_dists[best] < dists[q_first]
+        best = best[better]
+        q_first = q_first[better]
+        dists[q_first] = pair_dists[best]
+        c[q_first] = pair_c[best]
+        index[q_first] = tris[best]
+
+    def __getstate__(self):
+        state = {name: getattr(self, name) for name in self.fields}
+        state.update({"table_" + name: a
+                      for name, a in self.table.arrays().items()})
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        table = {name: state.pop("table_" + name)
+                 for name in TriangleTable.fields if "table_" + name in state}
+        self.__dict__.update(state)
+        if len(table) == len(TriangleTable.fields):
+            self.table = TriangleTable.from_arrays(table)
+        else:
+            self.table = TriangleTable(self.V, self.trig)
+
+    def save(self, path: str):
+        """Write the tree arrays to an uncompressed .npz file."""
+        np.savez(path, **self.__getstate__())
+
+    @classmethod
+    def load(cls, path: str) -> "CovTree":
+        """Read a tree written by save without rebuilding it."""
+        tree = cls.__new__(cls)
+        with np.load(path) as arrays:
+            tree.__setstate__({name: arrays[name] for name in arrays.files})
+        return tree
+
+
+def _ranges(first: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Concatenates range(first[j], first[j] + counts[j]) for every j."""
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+    return np.repeat(first, counts) + offsets
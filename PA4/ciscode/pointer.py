@@ -1,6 +1,7 @@
 from typing import Tuple
 import numpy as np
-from .frame import Frame
+from .frame import Frame, FrameBatch
+from . import profiling
 
 
 def pivot_calibration(
@@ -18,17 +19,17 @@ def pivot_calibration(
             is also returned.
     """
     F_0 = Frame(np.identity(3), -points[0].mean(axis=0))
-    m = 3 * points.shape[0]
-    RIs = np.empty((m, 6))
-    Ps = np.empty(m)
+    K = points.shape[0]
 
-    for k, st in enumerate(range(0, m, 3)):
-        F_0k = Frame.from_points(points[k], points[0])
-        F_k = F_0 @ F_0k
-        RIs[st : st + 3, :3] = F_k.r
-        RIs[st : st + 3, 3:] = -np.identity(3)
-        Ps[st : st + 3] = -F_k.p
+    # Register every frame to the first in one batch
+    F_k = F_0 @ FrameBatch.from_points(points, points[0])
+    RIs = np.empty((K, 3, 6))
+    RIs[:, :, :3] = F_k.r
+    RIs[:, :, 3:] = -np.identity(3)
+    RIs = RIs.reshape(3 * K, 6)
+    Ps = -F_k.p.ravel()
 
+    profiling.count("pointer.lstsq")
     x, _, _, _ = np.linalg.lstsq(RIs, Ps, rcond=None)
     post = x[:3]
     tip_tool = x[3:]
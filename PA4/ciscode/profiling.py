@@ -0,0 +1,130 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from typing import Callable
+import cProfile
+import json
+import time
+
+import logging
+
+log = logging.getLogger(__name__)
+
+# Off by default, and every hook checks it first, so the hooks left in
+# the search code cost one attribute lookup when nobody is profiling
+enabled = False
+
+# Event counts by name, e.g. "covtree.node_visits"
+counters = Counter()
+
+# Seconds and number of entries of every stage
+stage_times = defaultdict(float)
+stage_calls = Counter()
+
+
+def enable(on: bool = True):
+    """Turn instrumentation on or off."""
+    global enabled
+    enabled = on
+
+
+def reset():
+    """Clear every counter and timer."""
+    counters.clear()
+    stage_times.clear()
+    stage_calls.clear()
+
+
+def count(name: str, n: int = 1):
+    """Adds n to counter `name` while instrumentation is on."""
+    if enabled:
+        counters[name] += int(n)
+
+
+@contextmanager
+def stage(name: str):
+    """Times the block as stage `name` while instrumentation is on."""
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_times[name] += time.perf_counter() - start
+        stage_calls[name] += 1
+
+
+def timed(name: str = None) -> Callable:
+    """Decorator timing every call of a function as a stage.
+
+    Args:
+        name (str): Stage name, the function's qualified name by default.
+    """
+    def decorate(f):
+        label = name or f.__qualname__
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return f(*args, **kwargs)
+            with stage(label):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def report() -> dict:
+    """The stages and counters recorded so far."""
+    return {
+        "stages": {name: {"time": stage_times[name],
+                          "calls": stage_calls[name]}
+                   for name in stage_times},
+        "counters": dict(counters),
+    }
+
+
+def save_report(path: Path) -> Path:
+    """Writes `report()` as JSON."""
+    with open(path, "w") as f:
+        json.dump(report(), f, indent=2)
+    log.info(f"Saved profile to {path}")
+    return Path(path)
+
+
+def profile_run(run: Callable, name: str, inputs: dict,
+                cprofile: bool = False, **kwargs) -> dict:
+    """Runs one dataset with instrumentation on and saves its report.
+
+    The report goes to `<output_dir>/<name>-Profile.json` and, with
+    cprofile, the function-level stats to `<name>-Profile.pstats` (read
+    them with pstats or snakeviz).
+
+    Args:
+        run (Callable): The driver's run(name, inputs, **kwargs) -> record.
+        name (str): The dataset.
+        inputs (dict): Inputs shared by every dataset.
+        cprofile (bool): Also run under cProfile.
+        kwargs: Passed on to run, including output_dir.
+
+    Returns:
+        dict: The record returned by run.
+    """
+    reset()
+    enable()
+    profiler = cProfile.Profile() if cprofile else None
+    try:
+        with stage("total"):
+            if profiler is None:
+                record = run(name, inputs, **kwargs)
+            else:
+                record = profiler.runcall(run, name, inputs, **kwargs)
+    finally:
+        enable(False)
+
+    output_dir = Path(kwargs["output_dir"])
+    save_report(output_dir / f"{name}-Profile.json")
+    if profiler is not None:
+        profiler.dump_stats(output_dir / f"{name}-Profile.pstats")
+    return record
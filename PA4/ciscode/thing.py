@@ -1,12 +1,22 @@
 import numpy as np
-from ciscode import frame
+from ciscode import frame, closest
 
 
 class TriangleThing:
 
+    # corners as the single triangle of a three-vertex mesh
+    indices = np.array([[0, 1, 2]])
+
     def __init__(self, corners: np.ndarray) -> None:
         """Initialize triangle thing using triangle vertices."""
         self.corners = corners
+        self._table = None
+
+    @property
+    def table(self) -> closest.TriangleTable:
+        if self._table is None:
+            self._table = closest.TriangleTable(self.corners, self.indices)
+        return self._table
 
     def sortPoint(self) -> np.ndarray:
         """Returns the mean point that can be used to sort the object."""
@@ -46,11 +56,78 @@ class TriangleThing:
 
     def closestPointTo(self, v: np.ndarray) -> np.ndarray:
         """Find closest triangle point to given vector."""
-        max_point = 0
-        min_dist = np.inf
-        for i in range(3):
-            point = self.corners[i]
-            if (np.linalg.norm(point - v) < min_dist):
-                min_dist = np.linalg.norm(point - v)
-                max_point = point
-        return max_point
+        _, c, _ = self.table.closest_points(v)
+        return c[0]
+
+
+class TriangleSet:
+    """Triangles stored as index rows into one shared vertex array.
+
+    A compact stand-in for a list of TriangleThing: there are no
+    per-triangle objects or corner copies, and the Thing methods work on
+    every triangle of the set at once. Slicing or indexing with an array
+    gives the subset as another TriangleSet over the same vertices, while
+    an integer index gives that triangle as a TriangleThing.
+    """
+
+    __slots__ = ("V", "trig", "index", "_table")
+
+    def __init__(self, V: np.ndarray, trig: np.ndarray,
+                 index: np.ndarray = None,
+                 table: closest.TriangleTable = None) -> None:
+        """Initialize the set from a mesh.
+
+        Args:
+            V (np.ndarray): (N_v, 3) array of mesh vertices
+            trig (np.ndarray): (N_t, >=3) array of triangle vertex indices
+            index (np.ndarray): Triangles of the mesh in the set, all by
+                default
+            table (closest.TriangleTable): Triangle table of the whole
+                mesh, shared by its subsets; built when first needed
+        """
+        self.V = np.asarray(V, dtype=np.float64)
+        self.trig = np.ascontiguousarray(np.asarray(trig)[:, :3])
+        self.index = np.arange(self.trig.shape[0]) if index is None \
+            else np.asarray(index)
+        self._table = table
+
+    @classmethod
+    def from_things(cls, things: list) -> "TriangleSet":
+        """Pack a list of TriangleThing into a set."""
+        V = np.array([T.corners for T in things], dtype=np.float64)
+        return cls(V.reshape(-1, 3), np.arange(V.shape[0] * 3).reshape(-1, 3))
+
+    @property
+    def table(self) -> closest.TriangleTable:
+        if self._table is None:
+            self._table = closest.TriangleTable(self.V, self.trig)
+        return self._table
+
+    @property
+    def corners(self) -> np.ndarray:
+        """(N, 3, 3) corners of every triangle in the set."""
+        return self.V[self.trig[self.index]]
+
+    def __len__(self) -> int:
+        return self.index.shape[0]
+
+    def __getitem__(self, k):
+        if np.ndim(k) == 0 and not isinstance(k, slice):
+            return TriangleThing(self.V[self.trig[self.index[k]]])
+        return TriangleSet(self.V, self.trig, self.index[k], self._table)
+
+    def sortPoint(self) -> np.ndarray:
+        """Returns the (N, 3) mean points used to sort the triangles."""
+        return self.corners.mean(axis=1)
+
+    def enlargeBounds(self, F: frame, LB: np.ndarray, UB: np.ndarray) -> list:
+        """Given a frame F, and corners LB and UB of bounding box around
+        some other things, returns the corners of a bounding box that also
+        includes every triangle in the set."""
+        FiC = F.inv() @ self.corners.reshape(-1, 3)
+        return [np.minimum(LB, FiC.min(axis=0)), np.maximum(UB, FiC.max(axis=0))]
+
+    def closestPointTo(self, v: np.ndarray) -> np.ndarray:
+        """Find the closest point to v on any triangle in the set."""
+        _, c, _ = self.table[self.index].closest_points(v)
+        return c[0] if np.ndim(v) == 1 else c
@@ -1,12 +1,13 @@
 import click
+import contextlib
+import functools
 import logging
 from rich.logging import RichHandler
-from rich.progress import track
 import time
 from pathlib import Path
 import numpy as np
 
-from ciscode import readers, Frame, writers, closest, testing, thing, covtree
+from ciscode import readers, Frame, FrameBatch, writers, testing, evaluation, covtree, icp, parallel, profiling, runner
 
 
 FORMAT = "%(message)s"
@@ -20,62 +21,49 @@ logging.basicConfig(
 log = logging.getLogger()
 
 
-@click.command()
-@click.option("-d", "--data-dir", default="PA4/data", help="Where the data is.")
-@click.option("-o", "--output_dir", default="PA4/outputs", help="Where to store outputs.")
-@click.option("-n", "--name", default="PA4-A-Debug", help="Which experiment to run.")
-def main(
-    data_dir: str = "data", output_dir: str = "outputs", name: str = "BLAHHHH-"
-):
-    data_dir = Path(data_dir).resolve()
-    output_dir = Path(output_dir).resolve()
-    if not output_dir.exists():
-        output_dir.mkdir()
-
-    # Read inputs
+def load_inputs(data_dir: Path) -> dict:
+    """Reads the inputs shared by every dataset and builds the tree."""
     A_bod = readers.ProblemXBodyY(data_dir / f"Problem4-BodyA.txt")
     B_bod = readers.ProblemXBodyY(data_dir / f"Problem4-BodyB.txt")
     mesh = readers.ProblemXMesh(data_dir / f"Problem4MeshFile.sur")
     log.debug(mesh)
+    tree = covtree.CovTree(mesh.V, mesh.trig)
+    return {"A_bod": A_bod, "B_bod": B_bod, "mesh": mesh, "tree": tree}
+
+
+def run(name: str, inputs: dict, data_dir: Path, output_dir: Path,
+        check: bool = False, workers: int = 0, chunk_size: int = 0,
+        sidecar: bool = False, plots: bool = True) -> dict:
+    """Runs one dataset and returns its timing and errors."""
+    A_bod = inputs["A_bod"]
+    B_bod = inputs["B_bod"]
+    tree = inputs["tree"]
     sample_readings = readers.SampleReadings(
-        data_dir / f"{name}-SampleReadingsTest.txt")
+        data_dir / f"{name}-SampleReadingsTest.txt", stream=True)
 
     log.debug("point-cloud to point-cloud registration")
 
-    d = np.empty((sample_readings.N_samps, 3))
-
     # Start timing
     start_time = time.time()
 
-    for k in track(range(sample_readings.N_samps), "Computing d_k's..."):
-        # time.sleep(0.3)
-        marks = sample_readings.S[k]
-        a = marks[: A_bod.N_m]
-        b = marks[A_bod.N_m: A_bod.N_m + B_bod.N_m]
+    # Register sample frames a block at a time as they are read
+    d = []
+    with profiling.stage("register"):
+        for marks in sample_readings.blocks():
+            a = marks[:, : A_bod.N_m]
+            b = marks[:, A_bod.N_m: A_bod.N_m + B_bod.N_m]
+            F_A = FrameBatch.from_points(A_bod.Y, a)
+            F_B = FrameBatch.from_points(B_bod.Y, b)
 
-        F_A = Frame.from_points(A_bod.Y, a)
-        log.debug(f"{k}: F_A =\n{F_A}")
-        F_B = Frame.from_points(B_bod.Y, b)
-        log.debug(f"{k}: F_B =\n{F_B}")
-        d[k] = F_B.inv() @ F_A @ A_bod.t
+            # d_k = F_B,k^-1 @ F_A,k @ t for every sample in the block
+            d.append(F_B.inv() @ F_A @ A_bod.t[0])
+    d = np.concatenate(d)
 
     log.debug("computing s_k points using F_reg")
 
-    c = np.empty((sample_readings.N_samps, 3))
-    dists = np.ones((sample_readings.N_samps)) * np.inf
-
     # Initial guess for PA4
     F_reg = Frame(np.eye(3), np.array([0, 0, 0]))
 
-    # Contruct collection of Triangle Things
-    things = []
-    for i in range(mesh.N_t):
-        points = np.empty((3, 3))
-        for q in range(3):
-            index = mesh.trig[i, q]
-            points[q] = mesh.V[index]
-        things.append(thing.TriangleThing(points))
-
     # Now assume that is an unknown transformation such that
     # c = F*d. F = I, and for
     # Problem 4 you can use this as an initial guess. Compute sample
@@ -83,74 +71,112 @@ def main(
     # are closest to the s. For
     # Problem 4, you need to use these points to make a new estimate of
     # F and iterate until done.
-    tree = covtree.CovTreeNode(things)
-
-    convergence = False
-    iteration = 1
-    distHolder = np.ones((sample_readings.N_samps))
-    while (convergence == False):
-        for k in track(range(sample_readings.N_samps), "Computing s_k's..."):
-            s = F_reg @ d[k]
-            c_k = tree.findClosestPoint(s, dists[k])
-            if c_k is not None:
-                temp = np.linalg.norm(s - c_k)
-                if (temp < dists[k]):
-                    dists[k] = np.linalg.norm(s - c_k)
-                    c[k] = c_k
-        log.debug("Iteration:", iteration)
-        log.debug("Mean distance prev iteration:")
-        log.debug(np.mean(distHolder))
-        log.debug("Mean distance this iteration:")
-        log.debug(np.mean(dists))
-        if (np.isclose(np.mean(dists), np.mean(distHolder))):
-            convergence = True
-            log.debug("no change, convergence reached")
-        distHolder = dists.copy()
-        F_reg = Frame.from_points(d, c)
-        iteration = iteration + 1
-        log.debug(dists)
+    pool = parallel.ParallelSearch(tree, workers, chunk_size or None) \
+        if workers else contextlib.nullcontext(tree)
+    with pool as search:
+        F_reg, stats, matches = icp.icp(d, search, F_reg)
+        log.debug("ICP converged after %d iterations", len(stats))
+
+        # Closest points for the final registration
+        dists, c, _ = search.query_batch(
+            F_reg @ d, check=check, hint=matches.index)
 
     # End timing
     end_time = time.time()
     log.info(
         f"Execution Time: " f"{end_time - start_time}"
     )
+    record = {"name": name, "time": end_time - start_time}
 
     log.debug("writing output")
-    output = writers.PA4(name, d, c, dists)
-    output.save(output_dir)
+    # s_k = F_reg @ d_k, as in the reference outputs
+    output = writers.PA4(name, F_reg @ d, c, dists)
+    output.save(output_dir, sidecar=sidecar)
 
     ref_output_path = data_dir / (name + "-Output.txt")
     if ref_output_path.exists():
         ref = readers.OutputReader(ref_output_path)
-        log.info(
-            f"Mean d Error: " f"{np.linalg.norm(ref.d - output.d, axis=-1).mean()}"
-        )
-        log.info(
-            f"Max d Error: " f"{np.linalg.norm(ref.d - output.d, axis=-1).max()}"
-        )
-
-        log.info(
-            f"Mean c Error: " f"{np.linalg.norm(ref.c - output.c, axis=-1).mean()}"
-        )
-        log.info(
-            f"Max c Error: " f"{np.linalg.norm(ref.c - output.c, axis=-1).max()}"
-        )
-
-        log.info(
-            f"Mean Distance Error: " f"{np.linalg.norm(ref.diff - output.diff, axis=-1).mean()}"
-        )
-        log.info(
-            f"Max Distance Error: " f"{np.linalg.norm(ref.diff - output.diff, axis=-1).max()}"
-        )
-
+        record.update(testing.errors(output, ref))
+        log.info(f"Mean d Error: " f"{record['mean_d_error']}")
+        log.info(f"Max d Error: " f"{record['max_d_error']}")
+        log.info(f"Mean c Error: " f"{record['mean_c_error']}")
+        log.info(f"Max c Error: " f"{record['max_c_error']}")
+        log.info(f"Mean Distance Error: " f"{record['mean_distance_error']}")
+        log.info(f"Max Distance Error: " f"{record['max_distance_error']}")
+
+        refs = {"output": ref}
         ans_output_path = data_dir / (name + "-Answer.txt")
         if ans_output_path.exists():
-            ans = readers.OutputReader(ans_output_path)
+            refs["answer"] = readers.OutputReader(ans_output_path)
+
+        log.debug(
+            "validating results against output and answer files given")
+        result = evaluation.curves(output, refs)
+        evaluation.save_curves(result, output_dir / f"{name}-Accuracy.json")
+        if plots:
+            evaluation.plot_curves(name, result, Path("PA4/plots").resolve(),
+                                   background=True)
+
+    return record
+
+
+@click.command()
+@click.option("-d", "--data-dir", default="PA4/data", help="Where the data is.")
+@click.option("-o", "--output_dir", default="PA4/outputs", help="Where to store outputs.")
+@click.option("-n", "--name", default="PA4-A-Debug", help="Which experiment to run.")
+@click.option("-b", "--batch", default=None, help="Run every dataset matching a glob, e.g. 'PA4-*'.")
+@click.option("-j", "--jobs", default=0, help="Datasets run at once in batch mode, 0 uses every core.")
+@click.option("--check", is_flag=True, help="Cross-check tree searches against brute force.")
+@click.option("--workers", default=0, help="Closest-point worker processes, 0 searches in-process.")
+@click.option("--chunk-size", default=0, help="Query points per worker task, 0 splits each query evenly across the workers.")
+@click.option("--sidecar", is_flag=True, help="Also save the outputs as .npz arrays.")
+@click.option("--plots/--no-plots", default=True, help="Draw accuracy plots in the background.")
+@click.option("--profile", is_flag=True, help="Save stage timings and counters as <name>-Profile.json.")
+@click.option("--cprofile", is_flag=True, help="Like --profile, and also save cProfile stats as <name>-Profile.pstats.")
+@click.option("-q", "--quiet", is_flag=True, help="Plain log lines, warnings and batch progress only.")
+def main(
+    data_dir: str = "data", output_dir: str = "outputs", name: str = "BLAHHHH-",
+    batch: str = None, jobs: int = 0, check: bool = False, workers: int = 0,
+    chunk_size: int = 0, sidecar: bool = False, plots: bool = True,
+    profile: bool = False, cprofile: bool = False, quiet: bool = False
+):
+    data_dir = Path(data_dir).resolve()
+    output_dir = Path(output_dir).resolve()
+    if not output_dir.exists():
+        output_dir.mkdir()
+
+    if quiet:
+        # No rich rendering or per-dataset details, only warnings and one
+        # progress line per finished dataset in batch mode
+        logging.basicConfig(level="WARNING", format="[%(asctime)s] %(message)s",
+                            datefmt="%X", force=True)
+        logging.getLogger("ciscode.runner").setLevel(logging.INFO)
 
-            log.debug(
-                "run testing script to validate results against output and answer files given")
-            testing.resultsTable(name, output, ref, ans)
+    profile = profile or cprofile
+    profiling.enable(profile)
+
+    # Read inputs
+    with profiling.stage("load_inputs"):
+        inputs = load_inputs(data_dir)
+    if profile:
+        profiling.save_report(output_dir / "Inputs-Profile.json")
+        profiling.enable(False)
+    kwargs = dict(data_dir=data_dir, output_dir=output_dir,
+                  check=check, workers=workers, chunk_size=chunk_size,
+                  sidecar=sidecar, plots=plots)
+
+    run_dataset = run
+    if profile:
+        run_dataset = functools.partial(
+            profiling.profile_run, run, cprofile=cprofile)
+
+    if batch is None:
+        run_dataset(name, inputs, **kwargs)
+    else:
+        names = runner.find_datasets(data_dir, batch)
+        records = runner.run_batch(run_dataset, names, inputs, jobs, **kwargs)
+        runner.write_summary(records, output_dir)
+    evaluation.join_plots()
 
 
 if __name__ == "__main__":
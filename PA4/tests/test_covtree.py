@@ -0,0 +1,249 @@
+import pickle
+import numpy as np
+
+from ciscode import closest, covtree, profiling, thing
+
+
+def make_mesh(n: int = 20, seed: int = 0):
+    """A bumpy height field with 2 (n - 1)^2 triangles."""
+    rng = np.random.default_rng(seed)
+    x, y = np.meshgrid(np.linspace(0, 50, n), np.linspace(0, 50, n))
+    z = 5 * np.sin(x / 7) * np.cos(y / 9) + rng.normal(scale=0.2, size=x.shape)
+    V = np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1)
+    i = np.arange(n * n).reshape(n, n)[:-1, :-1].ravel()
+    trig = np.concatenate([
+        np.stack([i, i + 1, i + n], axis=1),
+        np.stack([i + 1, i + n + 1, i + n], axis=1),
+    ])
+    return V, trig
+
+
+def query_points(V, n: int = 50, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    return V[rng.integers(0, V.shape[0], n)] + rng.normal(scale=4, size=(n, 3))
+
+
+def test_find_closest_point_matches_brute_force():
+    V, trig = make_mesh()
+    tree = covtree.CovTree(V, trig)
+    points = query_points(V)
+    dists, c, _ = closest.closest_points(points, V, trig)
+    for k, v in enumerate(points):
+        dist, c_k, i = tree.find_closest_point(v)
+        assert np.isclose(dist, dists[k])
+        assert np.allclose(c_k, c[k])
+        assert np.isclose(closest.closest_points(v, V, trig[[i]])[0][0], dist)
+
+
+def test_find_closest_point_bound():
+    V, trig = make_mesh()
+    tree = covtree.CovTree(V, trig)
+    dist, c, i = tree.find_closest_point(np.array([25, 25, 100.0]), bound=10)
+    assert dist == np.inf and i == -1 and np.all(np.isnan(c))
+
+
+def test_save_load(tmp_path):
+    V, trig = make_mesh()
+    tree = covtree.CovTree(V, trig)
+    tree.save(tmp_path / "tree.npz")
+    for other in [covtree.CovTree.load(tmp_path / "tree.npz"),
+                  pickle.loads(pickle.dumps(tree))]:
+        for name in covtree.CovTree.fields:
+            assert np.array_equal(getattr(other, name), getattr(tree, name))
+        v = query_points(V, 1)[0]
+        assert other.find_closest_point(v)[2] == tree.find_closest_point(v)[2]
+
+
+def test_query_batch_matches_brute_force():
+    V, trig = make_mesh()
+    tree = covtree.CovTree(V, trig)
+    points = query_points(V, 200)
+    dists, c, i = closest.closest_points(points, V, trig)
+    b_dists, b_c, b_i = tree.query_batch(points)
+    assert np.allclose(b_dists, dists)
+    assert np.allclose(b_c, c)
+
+    # per-query bounds leave far points unmatched
+    bound = np.where(np.arange(200) % 2 == 0, np.inf, 1.0)
+    b_dists, b_c, b_i = tree.query_batch(points, bound)
+    missed = (np.arange(200) % 2 == 1) & (dists >= 1.0)
+    assert np.all(b_i[missed] == -1) and np.all(np.isinf(b_dists[missed]))
+    assert np.allclose(b_dists[~missed], dists[~missed])
+
+
+def test_max_radius_and_check():
+    V, trig = make_mesh()
+    tree = covtree.CovTree(V, trig)
+    points = query_points(V, 100)
+    dists, _, _ = closest.closest_points(points, V, trig)
+    b_dists, _, b_i = tree.query_batch(points, max_radius=2.0, check=True)
+    assert np.all((b_i < 0) == (dists >= 2.0))
+    assert np.isinf(tree.find_closest_point(points[0], max_radius=1e-6)[0])
+
+
+def test_legacy_tree_matches_brute_force():
+    V, trig = make_mesh(10)
+    things = [thing.TriangleThing(V[t]) for t in trig]
+    node = covtree.CovTreeNode(things)
+    points = query_points(V, 10)
+    _, c, _ = closest.closest_points(points, V, trig)
+    for k, v in enumerate(points):
+        assert np.allclose(node.findClosestPoint(v), c[k])
+    assert node.findClosestPoint(points[0], max_radius=1e-6) is None
+
+
+def test_build_structure():
+    V, trig = make_mesh()
+    tree = covtree.CovTree(V, trig, min_count=5)
+    inner = np.flatnonzero(tree.left >= 0)
+    leaves = np.flatnonzero(tree.left < 0)
+    assert np.all(tree.end[leaves] - tree.start[leaves] <= 5)
+    assert np.all(tree.left[inner] > inner) and np.all(tree.right[inner] > inner)
+    assert np.all(tree.start[tree.left[inner]] == tree.start[inner])
+    assert np.all(tree.end[tree.left[inner]] == tree.start[tree.right[inner]])
+    assert np.all(tree.end[tree.right[inner]] == tree.end[inner])
+    assert np.allclose(np.linalg.det(tree.R), 1)
+    assert sorted(tree.order) == list(range(trig.shape[0]))
+
+    # Every triangle lies in the box of each node holding it
+    for k in range(tree.n_nodes):
+        tris = tree.order[tree.start[k]:tree.end[k]]
+        local = (V[trig[tris]] - tree.p[k]) @ tree.R[k]
+        assert np.all(local >= tree.LB[k] - 1e-9)
+        assert np.all(local <= tree.UB[k] + 1e-9)
+
+
+def test_triangle_set():
+    V, trig = make_mesh(10)
+    triangles = thing.TriangleSet(V, trig)
+    assert len(triangles) == trig.shape[0]
+    assert np.allclose(triangles[5].corners, V[trig[5]])
+    assert np.allclose(triangles[2:7].sortPoint(), V[trig[2:7]].mean(axis=1))
+
+    # Subsets share the vertices instead of copying them
+    subset = triangles[[3, 1, 4]]
+    assert subset.V is triangles.V
+    points = query_points(V, 10)
+    _, c, _ = closest.closest_points(points, V, trig[[3, 1, 4]])
+    assert np.allclose(subset.closestPointTo(points), c)
+
+    node = covtree.CovTreeNode(triangles)
+    _, c, _ = closest.closest_points(points, V, trig)
+    for k, v in enumerate(points):
+        assert np.allclose(node.findClosestPoint(v), c[k])
+
+
+def test_query_batch_hint():
+    V, trig = make_mesh()
+    tree = covtree.CovTree(V, trig)
+    points = query_points(V, 100)
+    dists, c, i = tree.query_batch(points)
+
+    # exact, stale and missing hints all give the same answer
+    hint = i.copy()
+    hint[::3] = np.random.default_rng(2).integers(0, trig.shape[0], hint[::3].size)
+    hint[1::3] = -1
+    h_dists, h_c, h_i = tree.query_batch(points, hint=hint, check=True)
+    assert np.allclose(h_dists, dists)
+    assert np.allclose(h_c, c)
+    for k in range(5):
+        assert np.isclose(tree.find_closest_point(points[k], hint=hint[k])[0], dists[k])
+
+
+def test_triangle_neighbors():
+    V, trig = make_mesh(6)
+    indptr, neighbors = closest.triangle_neighbors(trig)
+    for i, t in enumerate(trig):
+        expected = [j for j, u in enumerate(trig) if set(t) & set(u)]
+        assert list(neighbors[indptr[i]:indptr[i + 1]]) == expected
+
+
+def test_refit():
+    V, trig = make_mesh()
+    tree = covtree.CovTree(V, trig)
+    LB, UB = tree.LB.copy(), tree.UB.copy()
+    assert not tree.refit()
+    assert np.allclose(tree.LB, LB) and np.allclose(tree.UB, UB)
+
+    # Move the vertices in place, as a deformable mesh would
+    tree.V += np.random.default_rng(2).normal(scale=0.5, size=V.shape)
+    assert not tree.refit()
+    for k in range(tree.n_nodes):
+        # Every box, refit bottom-up, still holds all of its triangles
+        tris = tree.order[tree.start[k]:tree.end[k]]
+        local = (tree.V[trig[tris]] - tree.p[k]) @ tree.R[k]
+        assert np.all(local >= tree.LB[k] - 1e-9)
+        assert np.all(local <= tree.UB[k] + 1e-9)
+    points = query_points(tree.V)
+    dists, _, _ = tree.query_batch(points)
+    brute, _, _ = closest.closest_points(points, tree.V, trig)
+    assert np.allclose(dists, brute)
+
+    # A large deformation inflates the boxes past the threshold
+    V_tall = V * [1, 1, 10]
+    assert tree.refit(V_tall, max_inflation=1.1)
+    dists, _, _ = tree.query_batch(points)
+    brute, _, _ = closest.closest_points(points, V_tall, trig)
+    assert np.allclose(dists, brute)
+    assert np.isclose(tree.size(), tree.box_size)
+
+
+def test_search_leaves_in_chunks():
+    V, trig = make_mesh()
+    tree = covtree.CovTree(V, trig)
+    # Far-away queries, so no leaf is pruned
+    points = query_points(V, 30) + [0, 0, 500]
+    leaves = np.flatnonzero(tree.left < 0)
+    q, leaves = np.tile(np.arange(30), leaves.size), np.repeat(leaves, 30)
+    expected, _, _ = closest.closest_points(points, V, trig)
+
+    for chunk_size in (7, 100, 10 ** 6):
+        dists = np.full(30, np.inf)
+        c, index = np.full((30, 3), np.nan), np.full(30, -1)
+        tree.search_leaves(q, leaves, points, dists, c, index, chunk_size)
+        assert np.allclose(dists, expected)
+
+
+def test_query_batch_visits():
+    V, trig = make_mesh(60)
+    tree = covtree.CovTree(V, trig)
+    points = query_points(V, 300)
+    profiling.enable()
+    try:
+        profiling.reset()
+        for v in points:
+            tree.find_closest_point(v)
+        single = dict(profiling.counters)
+        profiling.reset()
+        tree.query_batch(points)
+        batch = dict(profiling.counters)
+    finally:
+        profiling.enable(False)
+        profiling.reset()
+    # Bounds tighten leaf by leaf, so the batch does no more work per point
+    for name in ("covtree.node_visits", "closest.triangle_tests"):
+        assert batch[name] <= 1.05 * single[name]
+
+
+def test_query_batch_hint_visits():
+    V, trig = make_mesh(60)
+    tree = covtree.CovTree(V, trig)
+    rng = np.random.default_rng(2)
+    points = V[rng.integers(0, V.shape[0], 300)] + rng.normal(size=(300, 3))
+    _, _, hint = tree.query_batch(points)
+    counts = []
+    profiling.enable()
+    try:
+        for h in (None, hint):
+            profiling.reset()
+            tree.query_batch(points, hint=h)
+            counts.append(dict(profiling.counters))
+    finally:
+        profiling.enable(False)
+        profiling.reset()
+    plain, hinted = counts
+    # Best-first already visits only boxes nearer than the final bound, so
+    # a good hint cannot add visits; starting from that bound prunes more
+    # leaf triangles before they are evaluated
+    assert hinted["covtree.node_visits"] <= plain["covtree.node_visits"]
+    assert hinted["covtree.sphere_pruned"] > plain["covtree.sphere_pruned"]
@@ -0,0 +1,35 @@
+from pathlib import Path
+
+import pytest
+
+import pa4
+
+DATA = Path(__file__).resolve().parents[1] / "data"
+
+
+def test_output_matches_reference(tmp_path):
+    # B is registered away from the identity, so d_k and s_k differ
+    record = pa4.run("PA4-B-Debug", pa4.load_inputs(DATA), DATA, tmp_path,
+                     plots=False)
+    # The reference rows are rounded to 0.01
+    for key in ["max_d_error", "max_c_error", "max_distance_error"]:
+        assert record[key] < 0.02, key
+
+
+def test_pool_closed_on_error(tmp_path, monkeypatch):
+    closed = []
+
+    class Pool(pa4.parallel.ParallelSearch):
+        def close(self):
+            closed.append(True)
+            super().close()
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("did not converge")
+
+    monkeypatch.setattr(pa4.parallel, "ParallelSearch", Pool)
+    monkeypatch.setattr(pa4.icp, "icp", fail)
+    with pytest.raises(RuntimeError):
+        pa4.run("PA4-A-Debug", pa4.load_inputs(DATA), DATA, tmp_path,
+                  workers=1, plots=False)
+    assert closed
@@ -0,0 +1,70 @@
+import json
+import logging
+
+from ciscode import runner
+
+
+def square(name, inputs, offset=0):
+    return {"name": name, "time": 0.5, "value": inputs[name] ** 2 + offset}
+
+
+def test_find_datasets(tmp_path):
+    for name in ["PA4-A-Debug", "PA4-B-Debug", "PA4-G-Unknown"]:
+        (tmp_path / f"{name}-SampleReadingsTest.txt").touch()
+    (tmp_path / "PA4-A-Debug-Output.txt").touch()
+
+    assert runner.find_datasets(tmp_path, "PA4-*-Debug") == \
+        ["PA4-A-Debug", "PA4-B-Debug"]
+    assert len(runner.find_datasets(tmp_path, "*")) == 3
+
+
+def test_run_batch(tmp_path):
+    inputs = {"a": 2, "b": 3, "c": 4}
+    records = runner.run_batch(square, ["c", "a", "b"], inputs, jobs=2,
+                               offset=1)
+    assert [r["name"] for r in records] == ["c", "a", "b"]
+    assert [r["value"] for r in records] == [17, 5, 10]
+
+    path = runner.write_summary(records, tmp_path)
+    with open(path) as f:
+        summary = json.load(f)
+    assert summary["total_time"] == 1.5
+    assert summary["datasets"] == records
+
+
+def fragile(name, inputs):
+    if name == "b":
+        raise ValueError("bad readings")
+    return {"name": name, "time": 0.5, "value": inputs[name]}
+
+
+def test_run_batch_records_failures(tmp_path):
+    records = runner.run_batch(fragile, ["a", "b", "c"],
+                               {"a": 1, "b": 2, "c": 3}, jobs=2)
+    assert [r["value"] for r in records if "value" in r] == [1, 3]
+    assert records[1]["error"] == "ValueError: bad readings"
+
+    # The summary is still written, and lists the failure
+    path = runner.write_summary(records, tmp_path)
+    with open(path) as f:
+        summary = json.load(f)
+    assert summary["failed"] == ["b"]
+    assert summary["datasets"] == records
+
+
+def level(name, inputs):
+    return {"name": name, "time": 0.0, "level": logging.getLogger().level}
+
+
+def test_run_batch_progress(caplog):
+    root = logging.getLogger()
+    old = root.level
+    root.setLevel(logging.WARNING)
+    try:
+        with caplog.at_level(logging.INFO, logger="ciscode.runner"):
+            records = runner.run_batch(level, ["a", "b"], {}, jobs=2)
+    finally:
+        root.setLevel(old)
+    # Workers take the caller's level, progress is one line per dataset
+    assert [r["level"] for r in records] == [logging.WARNING] * 2
+    assert sum("datasets done" in m for m in caplog.messages) == 2
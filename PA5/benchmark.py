@@ -0,0 +1,57 @@
+import click
+import json
+import logging
+import sys
+from rich.logging import RichHandler
+from pathlib import Path
+
+from ciscode import benchmark, runner
+
+
+FORMAT = "%(message)s"
+logging.basicConfig(
+    level="INFO",
+    format=FORMAT,
+    datefmt="[%X]",
+    handlers=[RichHandler(rich_tracebacks=True)],
+)
+
+log = logging.getLogger()
+
+
+@click.command()
+@click.option("-d", "--data-dir", default="PA5/data", help="Where the data is.")
+@click.option("-o", "--output", default="PA5/outputs/benchmark.json", help="Where to store the results.")
+@click.option("-b", "--batch", default="PA5-*", help="PA5 datasets to time, a glob over dataset names.")
+@click.option("--sizes", default="1000,10000,100000,1000000", help="Synthetic mesh sizes in triangles, comma separated, or empty.")
+@click.option("--queries", default=1000, help="Query points per synthetic mesh.")
+@click.option("--baseline", default=None, help="Earlier results to check for regressions.")
+@click.option("--tolerance", default=1.5, help="Slowdown ratio that counts as a regression.")
+def main(
+    data_dir: str = "data", output: str = "benchmark.json",
+    batch: str = "PA5-*", sizes: str = "", queries: int = 1000,
+    baseline: str = None, tolerance: float = 1.5
+):
+    data_dir = Path(data_dir).resolve()
+    output = Path(output).resolve()
+    if not output.parent.exists():
+        output.parent.mkdir(parents=True)
+
+    names = runner.find_datasets(data_dir, batch)
+    sizes = [int(float(s)) for s in sizes.split(",") if s.strip()]
+    results = benchmark.run_benchmarks(data_dir, names, sizes, queries)
+    benchmark.save(results, output)
+    log.info(f"{len(names)} datasets and {len(sizes)} meshes timed, "
+             f"results written to {output}")
+
+    if baseline is not None:
+        with open(baseline) as f:
+            regressions = benchmark.compare(results, json.load(f), tolerance)
+        for key, ratio in sorted(regressions.items()):
+            log.warning(f"{key} is {ratio:.2f}x slower than the baseline")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+import copy
+import json
+import os
+import platform
+import time
+
+import numpy as np
+import logging
+
+from . import closest, covtree, deformable, icp, readers
+from .frame import Frame, FrameBatch
+
+log = logging.getLogger(__name__)
+
+# Deformable iterations timed per PA5 dataset
+DEFORM_ITERS = 3
+
+
+@contextmanager
+def timed(timings: Dict[str, float], stage: str):
+    """Adds the seconds spent in the block to timings[stage]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def environment() -> dict:
+    """Where the benchmark ran, stored with its results."""
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def load_problem(data_dir: Path) -> dict:
+    """Parses the inputs shared by every PA5 dataset.
+
+    Args:
+        data_dir (Path): Where the data is.
+
+    Returns:
+        dict: The inputs, as loaded by the driver, and their "timings".
+    """
+    data_dir = Path(data_dir)
+    timings = {}
+    inputs = {"timings": timings}
+    with timed(timings, "parse_bodies"):
+        inputs["A_bod"] = readers.ProblemXBodyY(
+            data_dir / "Problem5-BodyA.txt")
+        inputs["B_bod"] = readers.ProblemXBodyY(
+            data_dir / "Problem5-BodyB.txt")
+    with timed(timings, "parse_mesh"):
+        inputs["mesh"] = readers.ProblemXMesh(
+            data_dir / "Problem5MeshFile.sur", cache=False)
+    with timed(timings, "parse_modes"):
+        inputs["modes"] = readers.Problem5Modes(
+            data_dir / "Problem5Modes.txt", cache=False)
+    with timed(timings, "tree_build"):
+        inputs["tree"] = covtree.CovTree(inputs["modes"].Atlas[0],
+                                         inputs["mesh"].trig)
+    return inputs
+
+
+def bench_dataset(data_dir: Path, name: str, inputs: dict) -> dict:
+    """Times each stage of one PA5 dataset.
+
+    Args:
+        data_dir (Path): Where the data is.
+        name (str): The dataset, e.g. "PA5-A-Debug".
+        inputs (dict): Returned by load_problem.
+
+    Returns:
+        dict: The dataset's name, sample count and stage timings.
+    """
+    A_bod, B_bod = inputs["A_bod"], inputs["B_bod"]
+    timings = {}
+    record = {"name": name, "timings": timings}
+
+    with timed(timings, "parse"):
+        marks = readers.SampleReadings(
+            Path(data_dir) / f"{name}-SampleReadingsTest.txt").S
+    record["n_samples"] = marks.shape[0]
+
+    with timed(timings, "register"):
+        F_A = FrameBatch.from_points(A_bod.Y, marks[:, : A_bod.N_m])
+        F_B = FrameBatch.from_points(
+            B_bod.Y, marks[:, A_bod.N_m: A_bod.N_m + B_bod.N_m])
+        d = F_B.inv() @ F_A @ A_bod.t[0]
+
+    # Deforms its own copy, like the driver
+    tree = copy.deepcopy(inputs["tree"])
+    with timed(timings, "query"):
+        _, c, index = tree.query_batch(d)
+
+    with timed(timings, "icp"):
+        F_reg, stats, (_, c, index) = icp.icp(
+            d, tree, Frame(np.eye(3), np.zeros(3)))
+    record["icp_iterations"] = len(stats)
+
+    modes = inputs["modes"]
+    shape = deformable.DeformableMesh(modes.Atlas, inputs["mesh"].trig)
+    tree.V = shape.V
+    solver = deformable.ModeSolver()
+    with timed(timings, "deformable"):
+        for _ in range(DEFORM_ITERS):
+            _, q = closest.mode_coordinates(
+                c, index, shape.V, shape.trig, modes.Atlas)
+            l, _ = solver.solve(q, F_reg @ d)
+            shape.update(l)
+            tree.refit()
+            _, c, index = tree.query_batch(F_reg @ d, hint=index)
+    return record
+
+
+def synthetic_mesh(n_triangles: int, seed: int = 0):
+    """A bumpy square height field with about n_triangles triangles.
+
+    Args:
+        n_triangles (int): Target number of triangles.
+        seed (int): Seed of the surface noise.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The (N_v, 3) vertices and the
+            (N_t, 3) triangles.
+    """
+    n = max(2, int(round(np.sqrt(n_triangles / 2))) + 1)
+    rng = np.random.default_rng(seed)
+    x, y = np.meshgrid(np.linspace(0, 100, n), np.linspace(0, 100, n))
+    z = 10 * np.sin(x / 13) * np.cos(y / 17) \
+        + rng.normal(scale=0.2, size=x.shape)
+    V = np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1)
+    i = np.arange(n * n).reshape(n, n)[:-1, :-1].ravel()
+    trig = np.concatenate([
+        np.stack([i, i + 1, i + n], axis=1),
+        np.stack([i + 1, i + n + 1, i + n], axis=1),
+    ])
+    return V, trig
+
+
+def bench_mesh(n_triangles: int, n_queries: int = 1000,
+               brute_limit: int = 10 ** 4, seed: int = 0) -> dict:
+    """Times tree construction and closest-point queries on a synthetic mesh.
+
+    Args:
+        n_triangles (int): Target number of triangles.
+        n_queries (int): Query points near the surface.
+        brute_limit (int): Also time brute force up to this many triangles.
+        seed (int): Seed of the mesh and query points.
+
+    Returns:
+        dict: The mesh size, stage timings and query throughput.
+    """
+    V, trig = synthetic_mesh(n_triangles, seed)
+    rng = np.random.default_rng(seed + 1)
+    points = V[rng.integers(0, V.shape[0], n_queries)] \
+        + rng.normal(scale=2, size=(n_queries, 3))
+
+    timings = {}
+    with timed(timings, "tree_build"):
+        tree = covtree.CovTree(V, trig)
+    with timed(timings, "query"):
+        _, _, index = tree.query_batch(points)
+    with timed(timings, "query_hinted"):
+        tree.query_batch(points, hint=index)
+    if trig.shape[0] <= brute_limit:
+        with timed(timings, "brute_force"):
+            tree.table.closest_points(points)
+
+    return {"n_triangles": int(trig.shape[0]), "n_queries": n_queries,
+            "timings": timings,
+            "queries_per_second": n_queries / timings["query"]}
+
+
+def run_benchmarks(data_dir: Path, names: List[str],
+                   sizes: List[int] = (), n_queries: int = 1000) -> dict:
+    """Benchmarks PA5 datasets and synthetic meshes.
+
+    Each dataset is run through the stages of pa5.py, each timed on its
+    own: parsing, d_k registration, closest-point queries, ICP and the
+    deformable update. Only PA5 datasets are accepted, since the PA3 and
+    PA4 drivers use their own copies of the package. Synthetic meshes of
+    increasing size time tree construction and queries alone.
+
+    Args:
+        data_dir (Path): Where the data is.
+        names (List[str]): PA5 datasets, e.g. from runner.find_datasets.
+        sizes (List[int]): Synthetic mesh sizes, in triangles.
+        n_queries (int): Query points per synthetic mesh.
+
+    Returns:
+        dict: "environment", "problems", "datasets" and "synthetic" results.
+    """
+    others = [name for name in names if not name.startswith("PA5-")]
+    if others:
+        raise ValueError(f"only PA5 datasets can be benchmarked, not "
+                         f"{', '.join(others)}")
+    results = {"environment": environment(), "problems": {},
+               "datasets": [], "synthetic": []}
+    inputs = None
+    for name in names:
+        if inputs is None:
+            inputs = load_problem(data_dir)
+            results["problems"]["PA5"] = {"timings": inputs["timings"]}
+        record = bench_dataset(data_dir, name, inputs)
+        results["datasets"].append(record)
+        log.info(f"{name}: {_describe(record['timings'])}")
+
+    for size in sizes:
+        record = bench_mesh(size, n_queries)
+        results["synthetic"].append(record)
+        log.info(f"{record['n_triangles']} triangles: "
+                 f"{_describe(record['timings'])}")
+    return results
+
+
+def _describe(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{k} {v:.4f}s" for k, v in timings.items())
+
+
+def stage_times(results: dict) -> Dict[str, float]:
+    """Flattens results to {"<dataset or mesh>/<stage>": seconds}."""
+    flat = {}
+    for problem, record in results.get("problems", {}).items():
+        for stage, t in record["timings"].items():
+            flat[f"{problem}/{stage}"] = t
+    for record in results.get("datasets", []):
+        for stage, t in record["timings"].items():
+            flat[f"{record['name']}/{stage}"] = t
+    for record in results.get("synthetic", []):
+        for stage, t in record["timings"].items():
+            flat[f"mesh-{record['n_triangles']}/{stage}"] = t
+    return flat
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 1.5,
+            min_time: float = 1e-3) -> Dict[str, float]:
+    """Finds stages that got slower than an earlier run.
+
+    Args:
+        results (dict): This run.
+        baseline (dict): The earlier run, from the same machine.
+        tolerance (float): Slowdown ratio above which a stage regressed.
+        min_time (float): Stages faster than this in both runs are noise.
+
+    Returns:
+        Dict[str, float]: Slowdown ratio of every regressed stage.
+    """
+    now, before = stage_times(results), stage_times(baseline)
+    regressions = {}
+    for key in now.keys() & before.keys():
+        if max(now[key], before[key]) < min_time:
+            continue
+        ratio = now[key] / max(before[key], 1e-12)
+        if ratio > tolerance:
+            regressions[key] = ratio
+    return regressions
+
+
+def save(results: dict, path: Path) -> Path:
+    """Writes the results as JSON."""
+    path = Path(path)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    return path
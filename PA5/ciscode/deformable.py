@@ -0,0 +1,228 @@
+from typing import Tuple
+
+import numpy as np
+import logging
+from scipy.linalg import cho_factor, cho_solve
+
+from . import closest, icp, profiling
+from .frame import Frame
+
+log = logging.getLogger(__name__)
+
+
+class DeformableMesh:
+    """A mesh instance of a statistical shape atlas.
+
+    The vertices are the mean shape plus a weighted sum of the modes,
+    V = Atlas[0] + sum_m l_m Atlas[m]. `V` is updated in place and
+    `changed` lists the vertices that moved in the last update. A
+    closest-point structure sharing `V` (e.g. covtree.CovTree) sees the new
+    vertices but not the new shape: its bounding boxes are stale until the
+    caller runs `tree.refit()` after every update, as `fit` does.
+    """
+
+    def __init__(self, Atlas: np.ndarray, trig: np.ndarray,
+                 l: np.ndarray = None):
+        """Create the mesh instance for mode weights `l`.
+
+        Args:
+            Atlas (np.ndarray): (N_modes + 1, N_v, 3) mean shape and modes
+            trig (np.ndarray): (N_t, >=3) array of triangle vertex indices
+            l (np.ndarray): (N_modes,) mode weights, zero by default
+        """
+        self.Atlas = Atlas
+        self.trig = trig
+        self.N_modes = Atlas.shape[0] - 1
+
+        # Modes flattened to (N_modes, 3 N_v), so an update is one gemv
+        self.basis = np.ascontiguousarray(
+            Atlas[1:].reshape(self.N_modes, -1), dtype=np.float64)
+        self.mean = np.ascontiguousarray(Atlas[0], dtype=np.float64)
+
+        self.l = np.zeros(self.N_modes)
+        self.V = self.mean.copy()
+        self.changed = np.arange(self.V.shape[0])
+        if l is not None:
+            self.update(l)
+
+    def instance(self, l: np.ndarray) -> np.ndarray:
+        """Computes the vertices for mode weights `l` without storing them.
+
+        Args:
+            l (np.ndarray): (N_modes,) mode weights
+
+        Returns:
+            np.ndarray: (N_v, 3) array of vertices
+        """
+        return self.mean + (np.asarray(l) @ self.basis).reshape(-1, 3)
+
+    @profiling.timed("deformable.update")
+    def update(self, l: np.ndarray, tol: float = 0.0) -> np.ndarray:
+        """Moves the vertices to the instance for mode weights `l`.
+
+        Args:
+            l (np.ndarray): (N_modes,) mode weights
+            tol (float): Vertices that move by `tol` or less are left
+                unchanged
+
+        Returns:
+            np.ndarray: Indices of the vertices that moved
+        """
+        V = self.instance(l)
+        moved = np.any(np.abs(V - self.V) > tol, axis=1)
+        self.changed = np.flatnonzero(moved)
+        self.V[self.changed] = V[self.changed]
+        self.l = np.array(l, dtype=np.float64)
+        log.debug("%d vertices moved", self.changed.size)
+        return self.changed
+
+    def update_vertices(self, l: np.ndarray,
+                        vertices: np.ndarray) -> np.ndarray:
+        """Moves only `vertices` to the instance for mode weights `l`.
+
+        The rest of the mesh keeps its current shape, e.g. to deform the
+        triangles matched by a single sample, so afterwards `l` describes
+        only `vertices`.
+
+        Args:
+            l (np.ndarray): (N_modes,) mode weights
+            vertices (np.ndarray): Indices of the vertices to move
+
+        Returns:
+            np.ndarray: The indices of the vertices that were moved
+        """
+        vertices = np.unique(vertices)
+        self.V[vertices] = self.Atlas[0, vertices] + np.einsum(
+            "m,mvi->vi", l, self.Atlas[1:, vertices])
+        self.changed = vertices
+        self.l = np.array(l, dtype=np.float64)
+        return self.changed
+
+    def triangles(self, index: np.ndarray = None) -> np.ndarray:
+        """Corners of the triangles `index` (all by default), (N, 3, 3)."""
+        t = self.trig[:, :3] if index is None else self.trig[index, :3]
+        return self.V[t]
+
+
+class ModeSolver:
+    """Solves for the mode weights that best explain every sample at once.
+
+    Each sample point s_k should lie on the deformed mesh,
+    s_k = q_0k + sum_m l_m q_mk, so stacking all samples gives one
+    (3N x N_modes) least-squares system, solved through its normal
+    equations. The Cholesky factor of the normal matrix is cached and kept
+    while the matrix changes by less than `tol` (relative), refining the
+    solution against the current matrix instead of factoring again.
+    """
+
+    def __init__(self, tol: float = 1e-2, refine: int = 2):
+        """Create a solver with an empty factor cache.
+
+        Args:
+            tol (float): Largest relative change of the normal matrix for
+                which the cached factor is reused
+            refine (int): Iterative refinement steps with a reused factor
+        """
+        self.tol = tol
+        self.refine = refine
+        self.G = None
+        self.factor = None
+
+    @profiling.timed("deformable.solve")
+    def solve(self, q: np.ndarray,
+              s: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds the mode weights for all samples.
+
+        Args:
+            q (np.ndarray): (N, N_modes + 1, 3) mode points, mode 0 first,
+                see closest.mode_coordinates
+            s (np.ndarray): (N, 3) sample points
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The (N_modes,) mode weights and
+                the (N,) distances from each sample to its fitted point.
+        """
+        N, M = q.shape[0], q.shape[1] - 1
+        A = q[:, 1:].transpose(0, 2, 1).reshape(3 * N, M)
+        b = (s - q[:, 0]).reshape(3 * N)
+
+        G = A.T @ A
+        h = A.T @ b
+        reuse = self.G is not None and self.G.shape == G.shape and \
+            np.linalg.norm(G - self.G) <= self.tol * np.linalg.norm(self.G)
+        profiling.count("deformable.solves")
+        if not reuse:
+            profiling.count("deformable.factorizations")
+            self.G = G
+            self.factor = cho_factor(G)
+        l = cho_solve(self.factor, h)
+        if reuse:
+            for _ in range(self.refine):
+                l += cho_solve(self.factor, h - G @ l)
+        log.debug("mode weights %s", "refined" if reuse else "factored")
+
+        residuals = np.linalg.norm((A @ l - b).reshape(N, 3), axis=1)
+        return l, residuals
+
+
+@profiling.timed("deformable.fit")
+def fit(points: np.ndarray, shape: DeformableMesh, tree, surface=None,
+        F_0: Frame = None, solver: ModeSolver = None, max_iter: int = 50,
+        tol: float = 1e-3) -> Tuple[Frame, np.ndarray, np.ndarray]:
+    """Registers `points` to the atlas, fitting the pose and mode weights.
+
+    Alternates rigid ICP against the current instance with a global solve
+    for the mode weights, moving `shape` and refitting `tree` after every
+    solve. The weights converge linearly, so each step understates how far
+    they still have to go: the loop stops once the remaining change,
+    estimated from the ratio of the last two steps, is at most `tol`
+    relative to the weights. The mean residual alone flattens out long
+    before the weights settle.
+
+    Args:
+        points (np.ndarray): (N, 3) points to register
+        shape (DeformableMesh): Instance to fit, updated in place
+        tree (covtree.CovTree): Tree sharing its vertices with `shape`
+        surface: Closest-point search used by ICP, `tree` by default, e.g.
+            a parallel.ParallelSearch over `tree`
+        F_0 (Frame): Initial pose, identity by default
+        solver (ModeSolver): Mode weight solver, a new one by default
+        max_iter (int): Most pose and weight updates
+        tol (float): Largest relative change of the weights to stop at
+
+    Returns:
+        Tuple[Frame, np.ndarray, np.ndarray]: The pose, the (N_modes,) mode
+            weights and the triangle matched by each point in the last
+            iteration.
+    """
+    surface = tree if surface is None else surface
+    solver = ModeSolver() if solver is None else solver
+    F = Frame(np.eye(3), np.zeros(3)) if F_0 is None else F_0
+    tris, step = None, np.inf
+    for i in range(max_iter):
+        F, stats, (_, c, tris) = icp.icp(
+            points, surface, F, converged=icp.residual_change(rtol=0, atol=.1))
+        s = F @ points
+
+        # q_mk from the barycentric coordinates of every c_k in its triangle
+        _, qs = closest.mode_coordinates(c, tris, shape.V, shape.trig,
+                                         shape.Atlas)
+        prev = shape.l
+        l, residuals = solver.solve(qs, s)
+
+        # Move the mesh and refit the tree boxes around it
+        shape.update(l)
+        tree.refit()
+        if hasattr(surface, "sync"):
+            surface.sync()
+
+        # Remaining change of a geometric series with the last step ratio
+        prev_step, step = step, np.linalg.norm(l - prev)
+        rate = min(step / prev_step, 1) if prev_step > 0 else 0
+        remaining = step * rate / (1 - rate) if rate < 1 else np.inf
+        log.debug("Iteration %d: %d ICP iterations, mean residual %.4f, "
+                  "weight change %.4g, l = %s", i + 1, len(stats),
+                  residuals.mean(), step, l)
+        if max(step, remaining) <= tol * max(np.linalg.norm(l), 1):
+            break
+    return F, shape.l, tris
@@ -0,0 +1,151 @@
+from multiprocessing import Process
+from pathlib import Path
+from typing import Dict, List
+import json
+
+import numpy as np
+import logging
+
+from . import profiling
+
+log = logging.getLogger(__name__)
+
+# Background plotting processes not yet joined, see join_plots
+_plotting: List[Process] = []
+
+# Error margins, in mm, of the accuracy curves
+THRESHOLDS = np.array([.001, 0.0025, 0.005, 0.0075, 0.01, 0.025,
+                       0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 7.5,
+                       10, 15])
+
+# Quantities compared, with the output attribute and a plot label
+QUANTITIES = {
+    "d": ("d", "d point coordinates"),
+    "c": ("c", "c point coordinates"),
+    "diff": ("diff", "d - c difference"),
+}
+
+
+def accuracy(comp: np.ndarray, true: np.ndarray,
+             thresholds: np.ndarray = THRESHOLDS) -> np.ndarray:
+    """Percent of samples within each threshold of the reference.
+
+    A sample is accurate when every one of its coordinates is off by less
+    than the threshold.
+
+    Args:
+        comp (np.ndarray): (N,) or (N, k) computed values
+        true (np.ndarray): Reference values of the same shape
+        thresholds (np.ndarray): (T,) error margins
+
+    Returns:
+        np.ndarray: (T,) percent of accurate samples per threshold
+    """
+    err = np.abs(np.asarray(comp) - np.asarray(true))
+    if err.ndim > 1:
+        err = err.max(axis=tuple(range(1, err.ndim)))
+    # NaN errors compare False, so they count as inaccurate
+    within = err[None, :] < np.asarray(thresholds)[:, None]
+    return 100 * within.mean(axis=1)
+
+
+@profiling.timed("evaluate")
+def curves(out, refs: Dict[str, object],
+           thresholds: np.ndarray = THRESHOLDS) -> dict:
+    """Inaccuracy curves of every quantity against every reference.
+
+    Args:
+        out: Computed outputs, e.g. a writers.PA5
+        refs (Dict[str, object]): References by name, e.g. {"output":
+            readers.OutputReader(...), "answer": ...}
+        thresholds (np.ndarray): (T,) error margins
+
+    Returns:
+        dict: "thresholds", then for each reference name and quantity the
+            (T,) percent of inaccurate samples ("inaccuracy") and the
+            smallest threshold with under 1% inaccurate samples, or -1
+            ("acceptable").
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    result = {"thresholds": thresholds}
+    for ref_name, ref in refs.items():
+        result[ref_name] = {}
+        for key, (attr, _) in QUANTITIES.items():
+            inaccuracy = 100 - accuracy(getattr(out, attr),
+                                        getattr(ref, attr), thresholds)
+            ok = np.flatnonzero(inaccuracy < 1)
+            result[ref_name][key] = {
+                "inaccuracy": inaccuracy,
+                "acceptable": float(thresholds[ok[0]]) if ok.size else -1.0,
+            }
+    return result
+
+
+def to_json(result) -> object:
+    """Curves as JSON-serializable lists and floats."""
+    if isinstance(result, dict):
+        return {k: to_json(v) for k, v in result.items()}
+    if isinstance(result, np.ndarray):
+        return result.tolist()
+    return result
+
+
+def save_curves(result: dict, path: Path) -> Path:
+    """Writes the curves returned by `curves` as JSON."""
+    with open(path, "w") as f:
+        json.dump(to_json(result), f, indent=2)
+    return Path(path)
+
+
+def plot_curves(name: str, result: dict, output_dir: Path,
+                background: bool = False):
+    """Saves one inaccuracy-versus-threshold figure per curve.
+
+    Args:
+        name (str): Dataset name, used in titles and file names
+        result (dict): Curves returned by `curves`
+        output_dir (Path): Where to store the figures
+        background (bool): Draw in a separate process and return it
+            without waiting, so the caller does not pay for matplotlib.
+            The process must be waited for with `join_plots`
+
+    Returns:
+        Optional[Process]: The plotting process if background is set
+    """
+    if background:
+        process = Process(target=plot_curves, args=(name, result, output_dir))
+        process.start()
+        _plotting.append(process)
+        return process
+
+    # Only drawing needs matplotlib, so it is imported here
+    from matplotlib import pyplot as plt
+
+    output_dir = Path(output_dir)
+    if not output_dir.exists():
+        output_dir.mkdir()
+
+    thresholds = result["thresholds"]
+    for key, (_, label) in QUANTITIES.items():
+        for ref_name, ref_curves in result.items():
+            if ref_name == "thresholds":
+                continue
+            curve = ref_curves[key]
+            fig = plt.figure()
+            plt.title("{:s} Threshold for Error Margin: {:.2f}".format(
+                name, curve["acceptable"]))
+            plt.xlabel("threshold margin of error for {:s}".format(label))
+            plt.ylabel(
+                "% of points determined to be incorrect compared to {:s} file".format(ref_name))
+            plt.ylim(-.1, 100)
+            plt.plot(thresholds, curve["inaccuracy"])
+            file = "{:s} {:s} thresholds for {:s}".format(name, ref_name, label)
+            plt.savefig(output_dir / file)
+            plt.close(fig)
+    log.debug("accuracy plots saved to %s", output_dir)
+
+
+def join_plots():
+    """Waits for every background plot started by this process."""
+    while _plotting:
+        _plotting.pop().join()
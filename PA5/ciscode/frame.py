@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Union
+from typing import Iterable, Union
 from typing import Type
 
 import numpy as np
@@ -20,11 +20,11 @@ class Frame:
         self.r = np.array(r)
         self.p = np.array(p)
 
-    def __array__(self):
+    def __array__(self, dtype=None, copy=None):
         out = np.eye(4, dtype=np.float64)
         out[:3, :3] = self.r
         out[:3, 3] = self.p
-        return out
+        return out if dtype is None else out.astype(dtype)
 
     def __str__(self):
         return np.array_str(np.array(self), precision=4, suppress_small=True)
@@ -46,11 +46,14 @@ class Frame:
             return (self.r @ other.T).T + self.p
         elif isinstance(other, Frame):
             return Frame(self.r @ other.r, self.r @ other.p + self.p)
+        elif isinstance(other, FrameBatch):
+            return FrameBatch(self.r @ other.r, other.p @ self.r.T + self.p)
         else:
             raise TypeError
 
     @classmethod
-    def from_points(cls: Type[Frame], a: np.ndarray, b: np.ndarray) -> Frame:
+    def from_points(cls: Type[Frame], a: np.ndarray, b: np.ndarray,
+                    weights: np.ndarray = None) -> Frame:
         """Register the two point clouds with F_BA, where b = F_BA @ a.
 
         ..
@@ -67,6 +70,8 @@ class Frame:
             cls (Type[Frame]): The class.
             a (np.ndarray): Array of points in frame A.
             b (np.ndarray): Array of corresponding points in frame B.
+            weights (np.ndarray): Optional non-negative weight per point
+                pair, e.g. to down-weight outliers.
 
         Raises:
             RuntimeError: If the points fail to register.
@@ -74,38 +79,163 @@ class Frame:
         Returns:
             Frame: The F_BA transform.
         """
-        N = a.shape[0]
+        w = None if weights is None else weights[np.newaxis]
+        return FrameBatch.from_points(a[np.newaxis], b[np.newaxis], w)[0]
 
-        # get centroids
-        a_m = a.mean(axis=0)
-        b_m = b.mean(axis=0)
+    @classmethod
+    def from_icp(cls: Type[Frame], xs: np.ndarray, ys, F_0: Frame = None,
+                 max_iter: int = 100, converged=None, reject=None):
+        """Register `xs` to `ys` with iterative closest point, ys = F @ xs.
+
+        Args:
+            cls (Type[Frame]): The class.
+            xs (np.ndarray): (N, 3) points to register.
+            ys: The target, see `icp.matcher`: a covariance tree, a
+                (vertices, triangles) pair or an (M, 3) point cloud.
+            F_0 (Frame): Initial guess, identity by default.
+            max_iter (int): Maximum number of iterations.
+            converged: Convergence test, see `icp.residual_change`.
+            reject: Outlier rejection, see `icp.reject_above`.
+
+        Returns:
+            Tuple[Frame, List[icp.IterationStats]]: The registration and the
+                stats of every iteration.
+        """
+        from . import icp
+
+        F, stats, _ = icp.icp(xs, ys, F_0, max_iter, converged, reject)
+        return F, stats
+
+    @classmethod
+    def from_surface_registration(cls: Type[Frame], points: np.ndarray,
+                                  surface, F_0: Frame = None, **kwargs):
+        """Register `points` to a mesh surface, see `from_icp`."""
+        return cls.from_icp(points, surface, F_0, **kwargs)
+
+
+class FrameBatch:
+    def __init__(self, r: np.ndarray, p: np.ndarray) -> None:
+        """Create a stack of K frames with rotations `r` and translations `p`.
+
+        Args:
+            r (np.ndarray): (K, 3, 3) rotations.
+            p (np.ndarray): (K, 3) translations.
+        """
+        self.r = np.array(r)
+        self.p = np.array(p)
+
+    def __len__(self) -> int:
+        return self.r.shape[0]
+
+    def __getitem__(self, k) -> Union[Frame, FrameBatch]:
+        if isinstance(k, (int, np.integer)):
+            return Frame(self.r[k], self.p[k])
+        return FrameBatch(self.r[k], self.p[k])
+
+    def __array__(self, dtype=None, copy=None):
+        out = np.tile(np.eye(4, dtype=np.float64), (len(self), 1, 1))
+        out[:, :3, :3] = self.r
+        out[:, :3, 3] = self.p
+        return out if dtype is None else out.astype(dtype)
+
+    @classmethod
+    def from_frames(cls: Type[FrameBatch], frames: Iterable[Frame]) -> FrameBatch:
+        """Stack individual frames into a batch."""
+        frames = list(frames)
+        return cls(np.stack([F.r for F in frames]),
+                   np.stack([F.p for F in frames]))
+
+    def inv(self) -> FrameBatch:
+        r_T = self.r.transpose(0, 2, 1)
+        return FrameBatch(r_T, -np.einsum("kij,kj->ki", r_T, self.p))
+
+    def __matmul__(self, other: Union[np.ndarray, Frame, FrameBatch]
+                   ) -> Union[np.ndarray, FrameBatch]:
+        """Compose with frames, or apply every frame to points.
+
+        Args:
+            other (Union[np.ndarray, Frame, FrameBatch]): A frame, applied
+                on the right of every frame in the batch; a batch of the
+                same length, composed frame by frame; or points. A (3,)
+                point or (N, 3) points are transformed by every frame,
+                giving (K, 3) or (K, N, 3), and (K, N, 3) points are
+                transformed by their own frame.
+
+        Returns:
+            Union[np.ndarray, FrameBatch]: The composed frames or
+                transformed points.
+        """
+        if isinstance(other, np.ndarray):
+            if other.ndim == 1:
+                return np.einsum("kij,j->ki", self.r, other) + self.p
+            elif other.ndim == 2:
+                return (np.einsum("kij,nj->kni", self.r, other)
+                        + self.p[:, np.newaxis])
+            else:
+                return (np.einsum("kij,knj->kni", self.r, other)
+                        + self.p[:, np.newaxis])
+        elif isinstance(other, Frame):
+            return FrameBatch(self.r @ other.r, self.r @ other.p + self.p)
+        elif isinstance(other, FrameBatch):
+            return FrameBatch(self.r @ other.r,
+                              np.einsum("kij,kj->ki", self.r, other.p) + self.p)
+        else:
+            raise TypeError
+
+    @classmethod
+    def from_points(cls: Type[FrameBatch], a: np.ndarray, b: np.ndarray,
+                    weights: np.ndarray = None) -> FrameBatch:
+        """Register K pairs of point clouds at once, b_k = F_k @ a_k.
+
+        Uses one stacked SVD for all K cross-covariance matrices, with the
+        reflection fix applied to each frame that needs it.
+
+        Args:
+            cls (Type[FrameBatch]): The class.
+            a (np.ndarray): (K, N, 3) points in frame A, or (N, 3) points
+                shared by every registration.
+            b (np.ndarray): (K, N, 3) corresponding points in frame B, or
+                (N, 3) points shared by every registration.
+            weights (np.ndarray): Optional (K, N) or (N,) non-negative
+                weight per point pair.
+
+        Raises:
+            RuntimeError: If any of the point clouds fail to register.
+
+        Returns:
+            FrameBatch: The K F_BA transforms.
+        """
+        a, b = np.broadcast_arrays(a, b)
+        if weights is None:
+            w = np.full(a.shape[:2], 1 / a.shape[1])
+        else:
+            w = np.broadcast_to(weights, a.shape[:2])
+            w = w / w.sum(axis=1, keepdims=True)
+
+        # get weighted centroids
+        a_m = np.einsum("kn,kni->ki", w, a)
+        b_m = np.einsum("kn,kni->ki", w, b)
 
         # get points in centroid frames
-        a_q = a - a_m
-        b_q = b - b_m
+        a_q = a - a_m[:, np.newaxis]
+        b_q = b - b_m[:, np.newaxis]
 
         # Solve SVD
-        H = np.sum([np.outer(a_q[i], b_q[i]) for i in range(N)], axis=0)
+        H = np.einsum("kn,kni,knj->kij", w, a_q, b_q)
         U, S, VT = np.linalg.svd(H)
-        V = VT.T
-        R = V @ U.T
+        V = VT.transpose(0, 2, 1)
+        R = V @ U.transpose(0, 2, 1)
 
         d = np.linalg.det(R)
-        if d < 0:
-            V[:, 2] *= -1
-            R = V @ U.T
+        flip = d < 0
+        if np.any(flip):
+            V[flip, :, 2] *= -1
+            R[flip] = V[flip] @ U[flip].transpose(0, 2, 1)
             d = np.linalg.det(R)
 
-        if not np.isclose(d, 1):
+        if not np.allclose(d, 1):
             raise RuntimeError(
-                f"det(R) = {d}, should be +1 for rotation matrices.")
-
-        return Frame(R, b_m - R @ a_m)
+                f"det(R) = {d[~np.isclose(d, 1)]}, should be +1 for "
+                f"rotation matrices.")
 
-    @classmethod
-    def from_icp(cls, xs, ys):
-        pass
-
-    @classmethod
-    def from_surface_registration(cls, points, surface):
-        pass
+        return cls(R, b_m - np.einsum("kij,kj->ki", R, a_m))
@@ -0,0 +1,202 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import math
+import os
+
+import numpy as np
+import logging
+
+from .closest import TriangleTable
+from . import profiling
+
+log = logging.getLogger(__name__)
+
+# Surface attached by each worker process and its shared blocks, see _attach
+_surface = None
+_surface_blocks = []
+
+
+def _open(name: str) -> shared_memory.SharedMemory:
+    """Maps an existing block without taking ownership of it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 every attach is tracked, but workers share the
+        # parent's resource tracker, which only unlinks the block once
+        return shared_memory.SharedMemory(name=name)
+
+
+def _attach(cls, specs: dict):
+    """Worker initializer, maps the shared arrays and rebuilds the surface."""
+    global _surface
+    arrays, blocks = {}, []
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = _open(shm_name)
+        blocks.append(shm)
+        arrays[name] = np.ndarray(shape, dtype, buffer=shm.buf)
+
+    if cls is None:
+        _surface = TriangleTable.from_arrays(arrays)
+    else:
+        _surface = cls.__new__(cls)
+        _surface.__setstate__(arrays)
+    # Keep the blocks mapped for as long as the worker lives
+    _surface_blocks.extend(blocks)
+
+
+def _search(points: np.ndarray, bound, max_radius, hint):
+    if isinstance(_surface, TriangleTable):
+        dists, c, index = _surface.closest_points(points)
+        if max_radius is not None:
+            bound = np.minimum(bound, max_radius)
+        miss = dists >= bound
+        dists[miss], c[miss], index[miss] = np.inf, np.nan, -1
+        return dists, c, index
+    return _surface.query_batch(points, bound, max_radius, hint=hint)
+
+
+def _query(points: np.ndarray, bound, max_radius, hint, profile: bool):
+    """Searches one chunk, returning its results and the counts it raised."""
+    profiling.enable(profile)
+    profiling.reset()
+    return _search(points, bound, max_radius, hint), dict(profiling.counters)
+
+
+class ParallelSearch:
+    """Closest-point queries split into chunks across worker processes.
+
+    Wraps either a tree with `query_batch` and `__getstate__` (e.g.
+    covtree.CovTree) or a (vertices, triangles) pair searched by brute
+    force, and offers the same `query_batch` interface, so it can stand in
+    for the tree anywhere, e.g. as an ICP surface.
+
+    The surface arrays are copied into shared memory once, so only query
+    points and results travel to the workers. Counters the workers raise
+    while profiling is on are merged into the caller's.
+    """
+
+    def __init__(self, surface, workers: int = None, chunk_size: int = None,
+                 min_chunk: int = 1):
+        """Copy the surface into shared memory and start the workers.
+
+        Args:
+            surface: A tree with `query_batch`, or a (vertices, triangles)
+                pair.
+            workers (int): Number of processes, all cores by default.
+            chunk_size (int): Query points sent to a worker per task. By
+                default every query is split evenly across the workers.
+            min_chunk (int): Smallest even split, so tiny queries are not
+                spread over more tasks than they are worth.
+        """
+        self.surface = surface
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.min_chunk = min_chunk
+        self.blocks = {}
+        self.pool = None
+        self.start()
+
+    def arrays(self) -> dict:
+        if isinstance(self.surface, tuple):
+            return TriangleTable(*self.surface).arrays()
+        return {name: np.asarray(a)
+                for name, a in self.surface.__getstate__().items()}
+
+    def start(self):
+        specs = {}
+        for name, a in self.arrays().items():
+            shm = shared_memory.SharedMemory(create=True,
+                                             size=max(a.nbytes, 1))
+            np.ndarray(a.shape, a.dtype, buffer=shm.buf)[...] = a
+            self.blocks[name] = (shm, a.shape, a.dtype)
+            specs[name] = (shm.name, a.shape, a.dtype)
+
+        cls = None if isinstance(self.surface, tuple) else type(self.surface)
+        self.pool = ProcessPoolExecutor(
+            self.workers, initializer=_attach, initargs=(cls, specs))
+        log.debug("closest-point pool with %d workers", self.workers)
+
+    def sync(self):
+        """Publish changes to the surface arrays, e.g. after a tree refit.
+
+        Arrays that kept their shape are copied into place; if any changed
+        shape the pool is restarted.
+        """
+        arrays = self.arrays()
+        if any(a.shape != self.blocks[name][1]
+               or a.dtype != self.blocks[name][2]
+               for name, a in arrays.items()):
+            self.close()
+            self.start()
+            return
+        for name, a in arrays.items():
+            shm, shape, dtype = self.blocks[name]
+            np.ndarray(shape, dtype, buffer=shm.buf)[...] = a
+
+    def chunk_length(self, N: int) -> int:
+        """Query points per task for a query of N points."""
+        if self.chunk_size:
+            return self.chunk_size
+        return max(math.ceil(N / self.workers), self.min_chunk, 1)
+
+    @profiling.timed("parallel.query_batch")
+    def query_batch(self, points: np.ndarray, bound: np.float64 = np.inf,
+                    max_radius: np.float64 = None, check: bool = False,
+                    hint: np.ndarray = None):
+        """Finds the closest surface point for every query point.
+
+        Args:
+            points (np.ndarray): (N, 3) array of query points
+            bound (np.float64): Only points closer than this are returned,
+                either one value or one per query
+            max_radius (np.float64): Optional cutoff, applied on top of bound
+            check (bool): Also run the tree's brute-force check
+            hint (np.ndarray): (N,) triangles likely to be close
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: The (N,) distances,
+                the (N, 3) closest points and the (N,) triangle indices.
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        N = points.shape[0]
+        bound = np.broadcast_to(np.asarray(bound, dtype=np.float64), (N,))
+        chunk = self.chunk_length(N)
+
+        futures = []
+        for st in range(0, N, chunk):
+            en = st + chunk
+            futures.append(self.pool.submit(
+                _query, points[st:en], bound[st:en], max_radius,
+                None if hint is None else hint[st:en], profiling.enabled))
+
+        dists = np.empty(N)
+        c = np.empty((N, 3))
+        index = np.empty(N, dtype=int)
+        for st, future in zip(range(0, N, chunk), futures):
+            (d, p, i), counts = future.result()
+            profiling.counters.update(counts)
+            dists[st:st + d.shape[0]] = d
+            c[st:st + d.shape[0]] = p
+            index[st:st + d.shape[0]] = i
+
+        if check and hasattr(self.surface, "check"):
+            limit = bound if max_radius is None else \
+                np.minimum(bound, max_radius)
+            self.surface.check(points, dists, limit)
+        return dists, c, index
+
+    def close(self):
+        """Stop the workers and free the shared memory."""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        for shm, _, _ in self.blocks.values():
+            shm.close()
+            shm.unlink()
+        self.blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
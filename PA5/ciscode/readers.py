@@ -1,6 +1,64 @@
+import json
+import logging
 import numpy as np
+from itertools import islice
 from pathlib import Path
 
+log = logging.getLogger(__name__)
+
+# Bump whenever a parser changes, so stale sidecars are rebuilt
+CACHE_VERSION = 2
+
+
+def cached(path, names, parse, cache: bool = True) -> dict:
+    """Loads arrays parsed from a text file, reusing a binary sidecar.
+
+    The arrays are saved as .npy files in a `<file>.cache` directory next to
+    the text file, keyed by its modification time, size and the parser
+    version (`CACHE_VERSION`). While the key matches they are memory-mapped
+    instead of parsed again.
+
+    Args:
+        path: The text file.
+        names (list): Names of the arrays `parse` returns.
+        parse (callable): Parses the text file into a dict of arrays.
+        cache (bool): Whether to read and write the sidecar at all.
+
+    Returns:
+        dict: The arrays by name, read-only when memory-mapped.
+    """
+    path = Path(path)
+    if not cache:
+        return parse()
+
+    stat = path.stat()
+    key = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+           "version": CACHE_VERSION}
+    sidecar = path.with_name(path.name + ".cache")
+    try:
+        with open(sidecar / "key.json", "r") as f:
+            if json.load(f) == key:
+                return {n: np.asarray(
+                    np.load(sidecar / f"{n}.npy", mmap_mode="r"))
+                    for n in names}
+    except (OSError, ValueError):
+        pass
+
+    arrays = parse()
+    try:
+        sidecar.mkdir(exist_ok=True)
+        (sidecar / "key.json").unlink(missing_ok=True)
+        for old in sidecar.glob("*.npy"):
+            old.unlink()
+        for n in names:
+            np.save(sidecar / f"{n}.npy", arrays[n])
+        # The key goes last, so a partial write is never trusted
+        with open(sidecar / "key.json", "w") as f:
+            json.dump(key, f)
+    except OSError as e:
+        log.debug("not caching %s: %s", path, e)
+    return arrays
+
 
 class ProblemXBodyY:
     """Parses the LED marker data."""
@@ -20,9 +78,17 @@ class ProblemXBodyY:
 class ProblemXMesh:
     """Parses the body surface definition data."""
 
-    def __init__(self, path: str):
+    def __init__(self, path: str, cache: bool = True):
         self.path = Path(path)
-        with open(path, "r") as f:
+        arrays = cached(self.path, ["V", "trig"], self.parse, cache)
+        self.V = arrays["V"]
+        # vertex indices for triangles
+        self.trig = arrays["trig"]
+        self.N_v = self.V.shape[0]  # number of vertices
+        self.N_t = self.trig.shape[0]  # number of triangles
+
+    def parse(self) -> dict:
+        with open(self.path, "r") as f:
             self.N_v = -1
             for i, line in enumerate(f):
                 if i == 0:
@@ -30,17 +96,25 @@ class ProblemXMesh:
                 if i == self.N_v+1:
                     self.N_t = int(line)  # number of triangles
 
-        self.V = np.loadtxt(
-            path, skiprows=1, max_rows=self.N_v, dtype=np.float64)
-        # vertex indices for triangles
-        self.trig = np.loadtxt(path, skiprows=self.N_v+2, dtype=int)
+        V = np.loadtxt(
+            self.path, skiprows=1, max_rows=self.N_v, dtype=np.float64,
+            ndmin=2)
+        trig = np.loadtxt(self.path, skiprows=self.N_v+2, dtype=int, ndmin=2)
+        return {"V": V, "trig": trig}
 
 
 class Problem5Modes:
-    """Reads in atlas modes for mesh vertices."""
+    """Reads in atlas modes for mesh vertices.
 
-    def __init__(self, path: str):
+    The file holds the mean shape (mode 0) followed by `N_modes` modes of
+    vertex displacements, so `Atlas` is (N_modes + 1, N_verts, 3). It is a
+    view of `vertex_modes`, which stores all modes of a vertex together so
+    that `Atlas[:, i]` and `Atlas[1:, i]` are contiguous.
+    """
+
+    def __init__(self, path: str, dtype=np.float64, cache: bool = True):
         self.path = path
+        self.dtype = np.dtype(dtype)
         with open(path, "r") as f:
             line = next(f)
             line = line.replace("=", " ")
@@ -48,16 +122,38 @@ class Problem5Modes:
             self.N_verts = int(toks[2])     # number of vertices
             self.N_modes = int(toks[4])     # number of modes
 
-        self.Atlas = np.empty([self.N_modes, self.N_verts, 3])
-        for m in range(self.N_modes):
-            self.Atlas[m] = np.loadtxt(path, delimiter=",", skiprows=(
-                2+m*(self.N_verts+1)), max_rows=self.N_verts, dtype=np.float64)
+        name = f"vertex_modes_{self.dtype.name}"
+        self.vertex_modes = cached(path, [name], self.parse, cache)[name]
+        self.Atlas = self.vertex_modes.transpose(1, 0, 2)
+
+    def parse(self) -> dict:
+        """Parses every mode in a single scan of the file."""
+        vertex_modes = np.empty(
+            [self.N_verts, self.N_modes + 1, 3], self.dtype)
+        with open(self.path, "r") as f:
+            next(f)
+            for m in range(self.N_modes + 1):
+                next(f)  # "Mode m : ..." header
+                text = "".join(islice(f, self.N_verts)).replace(",", " ")
+                arr = np.fromstring(text, dtype=self.dtype, sep=" ")
+                if arr.size != 3 * self.N_verts:
+                    raise RuntimeError(f"{self.path} ended in mode {m}")
+                vertex_modes[:, m] = arr.reshape(self.N_verts, 3)
+        return {f"vertex_modes_{self.dtype.name}": vertex_modes}
 
 
 class SampleReadings:
-    """Parses the sample readings data."""
+    """Parses the sample readings data.
 
-    def __init__(self, path):
+    With `stream=True` nothing but the header is read up front; iterate over
+    the readings (or their `blocks`) to parse sample frames from the file as
+    they are needed, in constant memory.
+    """
+
+    # Sample frames parsed per block when streaming
+    BLOCK_SIZE = 1024
+
+    def __init__(self, path, stream: bool = False):
         self.path = Path(path)
         with open(path, "r") as f:
             line = next(f)
@@ -66,28 +162,67 @@ class SampleReadings:
             self.N_s = int(toks[0])
             self.N_samps = int(toks[1])  # number of sample frames
 
-        arr = np.loadtxt(path, delimiter=",", skiprows=1, dtype=np.float64)
-        self.S = np.empty([self.N_samps, self.N_s, 3], np.float64)
-        for k, st in enumerate(range(0, arr.shape[0], self.N_s)):
-            self.S[k] = arr[st: st + self.N_s]
+        if not stream:
+            self.S = np.concatenate(list(self.blocks(self.N_samps)))
+
+    def blocks(self, block_size: int = None):
+        """Yields the sample frames in blocks, straight from the file.
+
+        Args:
+            block_size (int): Sample frames per block, `BLOCK_SIZE` by default.
+
+        Yields:
+            np.ndarray: (B, N_s, 3) array of frames, B <= block_size.
+        """
+        block_size = block_size or self.BLOCK_SIZE
+        with open(self.path, "r") as f:
+            next(f)
+            for st in range(0, self.N_samps, block_size):
+                n = min(block_size, self.N_samps - st) * self.N_s
+                text = "".join(islice(f, n)).replace(",", " ")
+                arr = np.fromstring(text, dtype=np.float64, sep=" ")
+                if arr.size != 3 * n:
+                    raise RuntimeError(
+                        f"{self.path} ended before sample frame {st}")
+                yield arr.reshape(-1, self.N_s, 3)
+
+    def __iter__(self):
+        """Yields the (N_s, 3) sample frames one at a time."""
+        for block in self.blocks():
+            yield from block
 
 
 class OutputReader:
-    """Parses a formatted output file for programming assignment 3."""
+    """Parses a formatted output file for programming assignments 3-5.
+
+    PA5 outputs also hold N_modes mode weights, after the header. When
+    the writer saved a binary sidecar (the same name with .npz) that is at
+    least as new as the text, the arrays are loaded from it instead.
+    """
 
     def __init__(self, path):
         self.path = Path(path)
+        sidecar = self.path.with_suffix(".npz")
+        if sidecar.exists() and \
+                sidecar.stat().st_mtime_ns >= self.path.stat().st_mtime_ns:
+            with np.load(sidecar) as arrays:
+                self.d = arrays["d"]
+                self.c = arrays["c"]
+                self.diff = arrays["diff"]
+                self.m = arrays["m"] if "m" in arrays.files else np.empty(0)
+            self.N_samps = self.diff.shape[0]
+            self.N_modes = self.m.shape[0]
+            return
+
         with open(path, "r") as f:
             line = next(f)
-            toks = line.split(" ")
+            toks = line.replace(",", " ").split()
             self.N_samps = int(toks[0])
-
-        arr = np.loadtxt(path, skiprows=1, dtype=np.float64)
-        self.d = np.empty([self.N_samps, 3], np.float64)
-        self.c = np.empty([self.N_samps, 3], np.float64)
-        self.diff = np.empty([self.N_samps], np.float64)
-
-        for s in range(self.N_samps):
-            self.d[s] = arr[s, 0:3]
-            self.c[s] = arr[s, 3:6]
-            self.diff[s] = arr[s, 6]
+            self.N_modes = int(toks[2]) if len(toks) > 2 else 0
+            arr = np.fromstring(f.read(), dtype=np.float64, sep=" ")
+
+        self.m = arr[: self.N_modes]  # mode weights
+        arr = arr[self.N_modes:].reshape(self.N_samps, 7)
+        self.d = arr[:, 0:3]
+        self.c = arr[:, 3:6]
+        self.diff = arr[:, 6]
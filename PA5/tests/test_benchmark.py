@@ -0,0 +1,39 @@
+from pathlib import Path
+
+import pytest
+
+from ciscode import benchmark
+
+DATA = Path(__file__).resolve().parents[1] / "data"
+
+
+def test_bench_mesh():
+    V, trig = benchmark.synthetic_mesh(1000)
+    assert abs(trig.shape[0] - 1000) < 100
+    record = benchmark.bench_mesh(1000, n_queries=50)
+    assert set(record["timings"]) == {"tree_build", "query", "query_hinted",
+                                      "brute_force"}
+    assert record["queries_per_second"] > 0
+
+
+def test_bench_dataset_and_compare(tmp_path):
+    results = benchmark.run_benchmarks(DATA, ["PA5-A-Debug"])
+    record = results["datasets"][0]
+    assert record["n_samples"] > 0
+    assert set(record["timings"]) == {"parse", "register", "query", "icp",
+                                      "deformable"}
+    assert "tree_build" in results["problems"]["PA5"]["timings"]
+    path = benchmark.save(results, tmp_path / "bench.json")
+    assert path.exists()
+
+    # A baseline twice as fast flags every stage that is not noise
+    baseline = {"datasets": [dict(record, timings={
+        k: v / 2 for k, v in record["timings"].items()})]}
+    regressions = benchmark.compare(results, baseline, min_time=0)
+    assert set(regressions) == {f"PA5-A-Debug/{k}" for k in record["timings"]}
+    assert benchmark.compare(results, results) == {}
+
+
+def test_other_assignments_rejected():
+    with pytest.raises(ValueError):
+        benchmark.run_benchmarks(DATA, ["PA5-A-Debug", "PA4-A-Debug"])
@@ -0,0 +1,110 @@
+import numpy as np
+
+from ciscode import closest
+
+
+V = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0]], dtype=np.float64)
+T = np.array([[0, 1, 2]])
+
+
+def test_closest_points_regions():
+    points = np.array([
+        [0.2, 0.2, 1.0],    # interior, above the face
+        [-1.0, -1.0, 0.0],  # vertex a
+        [2.0, -0.5, 0.0],   # vertex b
+        [-0.5, 2.0, 0.0],   # vertex c
+        [0.5, -1.0, 0.0],   # edge ab
+        [-1.0, 0.5, 0.0],   # edge ac
+        [1.0, 1.0, 0.0],    # edge bc
+    ])
+    expected = np.array([
+        [0.2, 0.2, 0.0],
+        [0.0, 0.0, 0.0],
+        [1.0, 0.0, 0.0],
+        [0.0, 1.0, 0.0],
+        [0.5, 0.0, 0.0],
+        [0.0, 0.5, 0.0],
+        [0.5, 0.5, 0.0],
+    ])
+    dists, c, i = closest.closest_points(points, V, T)
+    assert np.allclose(c, expected)
+    assert np.allclose(dists, np.linalg.norm(points - expected, axis=1))
+    assert np.all(i == 0)
+
+
+def test_closest_points_matches_sampling():
+    rng = np.random.default_rng(0)
+    V = rng.normal(size=(30, 3)) * 10
+    T = rng.integers(0, 30, size=(40, 3))
+    T = T[(T[:, 0] != T[:, 1]) & (T[:, 1] != T[:, 2]) & (T[:, 0] != T[:, 2])]
+    points = rng.normal(size=(25, 3)) * 10
+
+    # small chunks so the blocking is exercised
+    dists, c, i = closest.closest_points(points, V, T, chunk_size=64)
+
+    g = np.linspace(0, 1, 31)
+    s, u = np.meshgrid(g, g)
+    keep = s + u <= 1
+    s, u = s[keep], u[keep]
+    a, b, cc = V[T[:, 0]], V[T[:, 1]], V[T[:, 2]]
+    samples = (a[:, None] + s[None, :, None] * (b - a)[:, None]
+               + u[None, :, None] * (cc - a)[:, None]).reshape(-1, 3)
+    for k in range(points.shape[0]):
+        assert dists[k] <= np.linalg.norm(samples - points[k], axis=1).min() + 1e-9
+
+    # One point or many, the same distance, point and triangle
+    dist, c_k, i_k = closest.find_closest(points[3], V, T)
+    assert np.isclose(dist, dists[3])
+    assert np.allclose(c_k, c[3])
+    assert i_k == i[3]
+    for got, expected in zip(closest.find_closest(points, V, T), (dists, c, i)):
+        assert np.allclose(got, expected)
+
+
+def test_triangle_table():
+    rng = np.random.default_rng(1)
+    V = rng.normal(size=(20, 3))
+    T = np.array([[0, 1, 2], [3, 4, 5], [6, 7, 8], [6, 6, 9]])
+    table = closest.TriangleTable(V, T)
+    assert len(table) == 4
+    assert all(getattr(table, name).dtype == np.float64 and
+               getattr(table, name).flags.c_contiguous
+               for name in table.fields)
+
+    # Corners lie within the bounding spheres
+    corners = V[T]
+    gaps = np.linalg.norm(corners - table.center[:, None], axis=2)
+    assert np.all(gaps <= table.radius[:, None] + 1e-12)
+    assert table.inv_det[3] == 0
+
+    points = rng.normal(size=(10, 3))
+    dists, c, i = table.closest_points(points)
+    sub = table[[2, 0]]
+    sub_dists, _, _ = sub.closest_points(points)
+    assert np.all(sub_dists >= dists - 1e-12)
+
+    index = rng.integers(0, 4, size=10)
+    pair_dists, pair_c = table.closest_points_pairwise(points, index)
+    for k in range(10):
+        d, p, _ = closest.closest_points(points[k], V, T[index[k:k + 1]])
+        assert np.isclose(pair_dists[k], d[0])
+        assert np.allclose(pair_c[k], p[0])
+    assert np.all(table.sphere_distance(points, index) <= pair_dists + 1e-12)
+
+
+def test_mode_coordinates():
+    rng = np.random.default_rng(7)
+    V = rng.normal(size=(6, 3))
+    t = np.array([[0, 1, 2], [3, 4, 5], [1, 3, 5]])
+    atlas = rng.normal(size=(4, 6, 3))
+    index = np.array([0, 2, 1, 2])
+    w_true = rng.dirichlet(np.ones(3), 4)
+    c = np.einsum("nj,nji->ni", w_true, V[t[index]])
+
+    w, q = closest.mode_coordinates(c, index, V, t, atlas)
+    assert np.allclose(w, w_true)
+    assert q.shape == (4, 4, 3)
+    for k in range(4):
+        assert np.allclose(closest.barycentric(c[k], *V[t[index[k]]]), w[k])
+        for m in range(4):
+            assert np.allclose(q[k, m], w[k] @ atlas[m, t[index[k]]])
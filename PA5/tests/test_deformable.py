@@ -0,0 +1,104 @@
+import numpy as np
+
+from ciscode import Frame, closest, covtree, deformable
+from test_covtree import make_mesh
+
+
+def make_atlas(n_modes: int = 4, seed: int = 0):
+    V, trig = make_mesh(10)
+    rng = np.random.default_rng(seed)
+    Atlas = np.concatenate([V[np.newaxis],
+                            rng.normal(size=(n_modes,) + V.shape)])
+    return Atlas, trig
+
+
+def test_deformable_update():
+    Atlas, trig = make_atlas()
+    l = np.array([0.5, -1.0, 0.0, 2.0])
+    expected = Atlas[0] + sum(l[m] * Atlas[m + 1] for m in range(4))
+
+    shape = deformable.DeformableMesh(Atlas, trig)
+    assert np.array_equal(shape.V, Atlas[0])
+    changed = shape.update(l)
+    assert np.allclose(shape.V, expected)
+    assert changed.size == Atlas.shape[1]
+    assert np.allclose(shape.instance(l), expected)
+    assert shape.update(l).size == 0
+
+    # Only the modes that are nonzero at a vertex can move it
+    Atlas[1:, 3] = 0
+    shape = deformable.DeformableMesh(Atlas, trig, l)
+    assert 3 not in shape.update(2 * l)
+    assert np.allclose(shape.triangles([0]), shape.V[trig[[0]]])
+
+
+def test_deformable_update_vertices():
+    Atlas, trig = make_atlas()
+    l = np.array([0.5, -1.0, 0.0, 2.0])
+    shape = deformable.DeformableMesh(Atlas, trig)
+    shape.update_vertices(l, trig[0])
+    assert np.array_equal(shape.l, l)
+    expected = shape.instance(l)
+    assert np.allclose(shape.V[trig[0]], expected[trig[0]])
+    others = np.setdiff1d(np.arange(Atlas.shape[1]), trig[0])
+    assert np.array_equal(shape.V[others], Atlas[0, others])
+
+
+def test_deformable_shares_vertices_with_tree():
+    Atlas, trig = make_atlas()
+    shape = deformable.DeformableMesh(Atlas, trig)
+    tree = covtree.CovTree(shape.V, trig)
+    shape.update(np.ones(4))
+    assert np.shares_memory(tree.V, shape.V)
+    assert np.array_equal(tree.V, shape.V)
+
+
+def test_mode_solver():
+    Atlas, trig = make_atlas()
+    l = np.array([0.5, -1.0, 0.25, 2.0])
+    shape = deformable.DeformableMesh(Atlas, trig, l)
+    rng = np.random.default_rng(3)
+    index = rng.integers(0, trig.shape[0], 40)
+    w = rng.dirichlet(np.ones(3), 40)
+    s = np.einsum("nj,nji->ni", w, shape.triangles(index))
+
+    _, q = closest.mode_coordinates(s, index, shape.V, trig, Atlas)
+    solver = deformable.ModeSolver()
+    l_fit, residuals = solver.solve(q, s)
+    assert np.allclose(l_fit, l)
+    assert np.allclose(residuals, 0)
+
+    # Nearly the same system reuses the cached factor
+    factor = solver.factor
+    s_moved = s + rng.normal(scale=1e-4, size=s.shape)
+    l_moved, _ = solver.solve(q, s_moved)
+    assert solver.factor is factor
+    assert np.allclose(l_moved, np.linalg.lstsq(
+        q[:, 1:].transpose(0, 2, 1).reshape(-1, 4),
+        (s_moved - q[:, 0]).ravel(), rcond=None)[0])
+
+
+def test_fit_recovers_weights():
+    # Smooth modes normal to the height field, so every weight is observable
+    V, trig = make_mesh(16)
+    x, y, zero = V[:, 0], V[:, 1], np.zeros(V.shape[0])
+    Atlas = np.stack([V] + [np.stack([zero, zero, z], axis=1) for z in [
+        np.sin(x / 11), np.cos(y / 13), (x - 25) * (y - 25) / 625]])
+    l = np.array([2.0, -1.5, 3.0])
+    shape = deformable.DeformableMesh(Atlas, trig)
+
+    # Noise-free samples on the deformed instance, seen from a moved frame
+    rng = np.random.default_rng(3)
+    index = rng.integers(0, trig.shape[0], 200)
+    w = rng.dirichlet(np.ones(3), 200)
+    s = np.einsum("nj,nji->ni", w, shape.instance(l)[trig[index]])
+    a = 0.05
+    F = Frame(np.array([[np.cos(a), -np.sin(a), 0],
+                        [np.sin(a), np.cos(a), 0],
+                        [0, 0, 1]]), np.array([1.0, -0.5, 0.3]))
+
+    tree = covtree.CovTree(shape.V, trig)
+    F_fit, l_fit, _ = deformable.fit(F.inv() @ s, shape, tree, max_iter=500)
+    assert np.allclose(l_fit, l, atol=1e-2)
+    assert np.allclose(shape.V, shape.instance(l), atol=1e-2)
+    assert np.allclose(F_fit.r, F.r, atol=1e-3)
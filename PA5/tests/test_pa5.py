@@ -0,0 +1,35 @@
+from pathlib import Path
+
+import pytest
+
+import pa5
+
+DATA = Path(__file__).resolve().parents[1] / "data"
+
+
+def test_output_matches_reference(tmp_path):
+    # B is registered away from the identity, so d_k and s_k differ by
+    # about 3.7, far more than the pose error the atlas fit leaves
+    record = pa5.run("PA5-B-Debug", pa5.load_inputs(DATA), DATA, tmp_path,
+                     plots=False)
+    assert record["max_d_error"] < 1
+    assert record["mean_d_error"] < 0.5
+
+
+def test_pool_closed_on_error(tmp_path, monkeypatch):
+    closed = []
+
+    class Pool(pa5.parallel.ParallelSearch):
+        def close(self):
+            closed.append(True)
+            super().close()
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("did not converge")
+
+    monkeypatch.setattr(pa5.parallel, "ParallelSearch", Pool)
+    monkeypatch.setattr(pa5.deformable, "fit", fail)
+    with pytest.raises(RuntimeError):
+        pa5.run("PA5-A-Debug", pa5.load_inputs(DATA), DATA, tmp_path,
+                  workers=1, plots=False)
+    assert closed
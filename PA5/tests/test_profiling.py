@@ -0,0 +1,45 @@
+import json
+
+from ciscode import benchmark, covtree, profiling
+
+
+def test_disabled_records_nothing():
+    profiling.reset()
+    V, trig = benchmark.synthetic_mesh(200)
+    covtree.CovTree(V, trig).query_batch(V[:10] + 1)
+    assert profiling.report() == {"stages": {}, "counters": {}}
+
+
+def test_counts_tree_search():
+    V, trig = benchmark.synthetic_mesh(200)
+    tree = covtree.CovTree(V, trig)
+    profiling.reset()
+    profiling.enable()
+    try:
+        tree.query_batch(V[:10] + 1)
+        tree.find_closest_point(V[0] + 1)
+    finally:
+        profiling.enable(False)
+    report = profiling.report()
+    assert report["stages"]["covtree.query_batch"]["calls"] == 1
+    assert report["counters"]["covtree.node_visits"] > 0
+    assert report["counters"]["covtree.pruned_subtrees"] > 0
+    # The tree must test fewer pairs than brute force would
+    assert 0 < report["counters"]["closest.triangle_tests"] < 11 * len(trig)
+
+
+def test_profile_run(tmp_path):
+    def run(name, inputs, output_dir, scale):
+        with profiling.stage("work"):
+            profiling.count("items", 3)
+        return {"name": name, "value": inputs["x"] * scale}
+
+    record = profiling.profile_run(run, "demo", {"x": 2}, cprofile=True,
+                                   output_dir=tmp_path, scale=3)
+    assert record == {"name": "demo", "value": 6}
+    assert not profiling.enabled
+    with open(tmp_path / "demo-Profile.json") as f:
+        report = json.load(f)
+    assert set(report["stages"]) == {"total", "work"}
+    assert report["counters"] == {"items": 3}
+    assert (tmp_path / "demo-Profile.pstats").exists()
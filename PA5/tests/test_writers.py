@@ -0,0 +1,46 @@
+import numpy as np
+
+from ciscode import readers, writers
+
+
+def make_output(n: int = 10, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    s = rng.normal(scale=50, size=(n, 3))
+    c = s + rng.normal(size=(n, 3))
+    return writers.PA5("PA5-Z-Test", s, c, np.linalg.norm(s - c, axis=1),
+                       rng.normal(size=6))
+
+
+def test_write_matches_row_format():
+    output = make_output()
+    lines = str(output).split("\n")
+    assert lines[0] == "10, pa5-Z-Test-Output.txt, 6"
+    assert lines[1:7] == [f"  {m:>6.04f}" for m in output.m]
+    for i, line in enumerate(lines[7:]):
+        assert line == (
+            "  " + "   ".join(f"{x:>6.02f}" for x in output.s[i]) + "       "
+            + "   ".join(f"{x:>6.02f}" for x in output.c[i])
+            + f"    {output.diff[i]:>6.03f}")
+
+
+def test_save_blocks_and_sidecar(tmp_path):
+    output = make_output(25)
+    output.save(tmp_path, sidecar=True)
+    text = (tmp_path / output.fname).read_text()
+    assert text == str(output)
+
+    # Chunked writes give the same text
+    with open(tmp_path / "blocks.txt", "w") as f:
+        output.write(f, block_size=4)
+    assert (tmp_path / "blocks.txt").read_text() == text
+
+    ref = readers.OutputReader(tmp_path / output.fname)
+    assert np.array_equal(ref.d, output.s)
+    assert np.array_equal(ref.m, output.m)
+    assert ref.N_samps == 25 and ref.N_modes == 6
+
+    # Without the sidecar the rounded text is parsed
+    (tmp_path / output.fname).with_suffix(".npz").unlink()
+    ref = readers.OutputReader(tmp_path / output.fname)
+    assert np.allclose(ref.c, output.c, atol=5e-3)
+    assert np.allclose(ref.m, output.m, atol=5e-5)